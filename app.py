@@ -1,9 +1,9 @@
 import streamlit as st
-import pandas as pd
-import time
 import os
 import sys
+import tempfile
 import importlib.util
+from concurrent.futures import wait
 from urllib.parse import urlparse
 
 # business_research.py をパスに追加してインポート可能にする
@@ -12,6 +12,8 @@ sys.path.append(script_dir)
 
 try:
     import business_research as core
+    import quota_ledger
+    import scrape_pool
 except ImportError:
     st.error("business_research.py が見つかりません。同一フォルダに配置してください。")
     st.stop()
@@ -25,8 +27,7 @@ st.set_page_config(
 )
 
 # --- SaaS ログイン・ユーザー管理機能 ---
-import requests
-import json
+# requests / pandas は毎回の再実行では不要なため、実際に使う箇所で読み込む
 
 def check_login():
     """GAS API（DB）に問い合わせてログインを行う"""
@@ -65,7 +66,7 @@ def check_login():
                         "user_id": user_id,
                         "password": password
                     }
-                    response = requests.post(manager_url, json=payload, timeout=10)
+                    response = core.get_session().post(manager_url, json=payload, timeout=10)
                     if response.status_code == 200:
                         result = response.json()
                         if result.get("success"):
@@ -93,6 +94,55 @@ if not check_login():
     st.stop()
 
 
+@st.cache_resource
+def user_ledger(manager_url, user_id, _password, _current_usage, _max_usage):
+    """ユーザーごとに1つの利用枠台帳（同じユーザーの複数セッションで共有し、二重に送信しない）"""
+    return quota_ledger.UsageLedger(
+        manager_url, user_id, _password,
+        current_usage=_current_usage,
+        max_usage=_max_usage,
+    )
+
+
+def get_ledger():
+    """ログイン中のユーザーの利用枠台帳。再実行のたびにGASへ問い合わせず、TTL切れ時だけ裏で更新する"""
+    info = st.session_state.get("user_info", {})
+    ledger = user_ledger(
+        st.secrets.get("MANAGER_GAS_URL", ""),
+        info.get("user_id"),
+        st.session_state.get("password"),
+        info.get("current_usage", 0),
+        info.get("max_usage", 1000),
+    )
+    ledger.password = st.session_state.get("password")  # 最後にログインしたときのパスワードで送る
+    ledger.maybe_refresh()
+    return ledger
+
+
+@st.cache_resource
+def get_scrape_pool():
+    """全セッションで共有するスクレイピング・ワーカープール（プロセスに1つ）"""
+    return scrape_pool.ScrapePool()
+
+
+@st.cache_resource
+def get_path_stats():
+    """全セッションで共有するパス別の実績（セッションごとに作ると保存時に互いの件数を上書きしてしまう）"""
+    return core.PathYieldStats()
+
+
+def show_queue_position(box, q):
+    """共有プールでの順番待ちの状況を表示する"""
+    if q["ahead"]:
+        box.caption(f"⏳ 順番待ち中: 他のユーザーのサイト {q['ahead']} 件の後に処理されます"
+                    f"（現在 {q['users']} 人が利用中）")
+    else:
+        box.caption(f"⚙️ 処理中（あなたの待ち {q['pending']} 件 / 全体で {q['running']} サイトを同時に処理中）")
+
+
+ledger = get_ledger()
+
+
 # --- スタイル（近未来モダンUI / スマホ完全対応） ---
 st.markdown("""
     <style>
@@ -247,13 +297,16 @@ with st.sidebar:
     st.markdown("## 🚀 Dashboard")
     user_info = st.session_state.get("user_info", {})
     user_id = user_info.get('user_id', '未設定')
-    current_usage = user_info.get('current_usage', 0)
-    max_usage = user_info.get('max_usage', 0)
+    max_usage = ledger.max_usage
     
     st.markdown(f"**こんにちは、{user_id}さん！**")
     
-    # リッチなダッシュボード表示
-    st.metric(label="本日の残り利用可能枠", value=f"{max_usage - current_usage} 件", delta=f"/{max_usage} 上限", delta_color="off")
+    # リッチなダッシュボード表示（ローカル台帳の値なのでGASの応答を待たない）
+    st.metric(label="本日の残り利用可能枠", value=f"{ledger.available()} 件", delta=f"/{max_usage} 上限", delta_color="off")
+    if ledger.pending_count():
+        st.caption(f"🔄 利用実績 {ledger.pending_count()} 件をサーバーへ同期待ちです。")
+        if ledger.last_error:
+            st.caption(f"⚠️ 同期に失敗しています（自動で再送します）: {ledger.last_error}")
     
     st.divider()
     
@@ -279,6 +332,22 @@ with st.sidebar:
         type="password",
         help="サイトのテキストからAIが代表連絡先を正確に抽出するためのキーです"
     )
+    job_budget_min = st.number_input(
+        "⏱️ 処理時間の上限（分）",
+        min_value=1, max_value=120, value=15,
+        help="この時間を超えたら、それまでに集まった結果で終了します。"
+    )
+    llm_threshold = st.slider(
+        "🧠 AI抽出を使う確信度の上限",
+        min_value=0.0, max_value=1.05, value=core.LLM_CONFIDENCE_THRESHOLD, step=0.05,
+        help="通常の抽出で見つかった連絡先の確信度がこの値未満のサイトだけAIで抽出します。"
+             "1 を超えると常にAIを使います。"
+    )
+    overfetch_ratio = st.number_input(
+        "🔁 目標件数モードの調査上限（倍）",
+        min_value=1.0, max_value=10.0, value=core.OVERFETCH_RATIO, step=0.5,
+        help="連絡先が見つからないサイトを見越して、取得件数の何倍までサイトを調べるかの上限です。"
+    )
     st.divider()    
     st.info("このツールは、指定した条件で企業情報を収集し、CSV保存とスプレッドシートへの送信を行います。")
 
@@ -294,27 +363,25 @@ with col1:
 with col2:
     region = st.text_input("📍 地域", placeholder="例: 埼玉県, 渋谷区, 大阪")
 with col3:
-    max_usage_limit = st.session_state.get("user_info", {}).get("max_usage", 1000) - st.session_state.get("user_info", {}).get("current_usage", 0)
+    max_usage_limit = ledger.available()
     max_count = st.number_input("📥 取得件数", min_value=1, max_value=max(1, max_usage_limit), value=min(50, max(1, max_usage_limit)), step=10, help=f"本日の残り利用可能枠: {max_usage_limit}件")
 
 
-# urls.txt の読み込み（あれば）
+# urls.txt の件数（ファイルの更新時刻が変わらない限り、再実行のたびに読み直さない）
 urls_file = os.path.join(script_dir, "urls.txt")
 use_urls_txt = False
-urls_in_file = []
-if os.path.exists(urls_file):
-    try:
-        with open(urls_file, "r", encoding="utf-8-sig") as f:
-            urls_in_file = [line.strip() for line in f if line.strip().startswith("http")]
-    except Exception:
-        pass
+urls_in_file = 0
+try:
+    urls_in_file = core.url_file_count(urls_file)
+except Exception:
+    pass
 
 manual_urls_input = ""
 if urls_in_file:
     use_urls_txt = st.checkbox(
-        f"📁 登録済みの URL リストを使用する ({len(urls_in_file)} 件)", 
+        f"📁 登録済みの URL リストを使用する ({urls_in_file} 件)", 
         value=False,
-        help="urls.txt のリストを優先して処理します。"
+        help="urls.txt のリストを優先して処理します（同じドメインは1件にまとめます）。"
     )
     if use_urls_txt:
         st.info("⚠️ 登録済みリストモードです。下のキーワード検索は無視されます。")
@@ -327,28 +394,62 @@ else:
             help="検索がうまくいかない場合や、特定のサイトだけ調べたい時に便利です。"
         )
 
+target_mode = st.checkbox(
+    "🎯 連絡先が見つかった企業を取得件数ぶん集める",
+    value=False,
+    help="検索結果を少しずつ読み進めながら調査し、連絡先が見つかった企業が取得件数に達したら終了します。"
+         "利用枠は実際に調べたサイトの数だけ消費します。"
+)
+
+shard_mode = st.checkbox(
+    "🗾 地域を市区ごとに分けて検索する",
+    value=False,
+    help="「東京」「大阪府」「横浜市」などの広い地域を市区（政令指定都市は区）ごとの検索に分けて、"
+         "1回の検索では届かない件数まで集めます。"
+)
+
 start_button = st.button("リサーチを開始する", type="primary")
 
 if start_button:
-    results = []
+    import pandas as pd
+    results = core.ResultStore()  # 件数が多い場合はディスクへ退避する省メモリストア
     urls = []
+    url_chunks = None  # urls.txt は全件を読み込まず、チャンクごとに読みながら処理する
 
     if use_urls_txt:
-        urls = urls_in_file
+        url_chunks = core.iter_url_chunks(urls_file)
     elif manual_urls_input.strip():
         urls = [u.strip() for u in manual_urls_input.split("\n") if u.strip().startswith("http")]
     
-    if not urls and (not industry or not region):
+    if url_chunks is None and not urls and (not industry or not region):
         st.warning("業種と地域を入力するか、手動でURLを入力してください。")
     else:
         with st.status("🔍 調査中...", expanded=True) as status:
             # 1. URL収集
-            if urls:
+            if url_chunks is not None:
+                total = urls_in_file
+                st.write(f"✅ 登録済みリストの {urls_in_file} 件を {core.URL_CHUNK} 件ずつ読み込みながら処理します。")
+            elif urls:
                 st.write(f"✅ {len(urls)} 件のURLを読み込みました。")
+            elif target_mode:
+                # 検索結果は必要な分だけページを読み進め、先読みしながらスクレイピングへ流す
+                query = f"{industry} {region}"
+                st.write(f"🎯 {query} を検索しながら、連絡先のある企業を {max_count} 件集めます。")
+                if shard_mode:
+                    stream = core.iter_sharded_urls(industry, region, serper_api_key)
+                else:
+                    stream = core.iter_search_urls(query, serper_api_key)
+                url_chunks = core.prefetch(stream, batch=True)
+                total = max_count
             else:
                 query = f"{industry} {region}"
                 
-                if serper_api_key:
+                if shard_mode:
+                    shards = len(core.shard_queries(industry, region)) - 1
+                    st.write(f"🗾 {query} を {shards} 地域に分けて検索中..." if shards
+                             else f"🌎 {query} を検索中...（分割できる地域ではありません）")
+                    urls = core.search_sharded(industry, region, max_count, serper_api_key)
+                elif serper_api_key:
                     st.write(f"⚡ 高速検索APIを使用して {query} を検索中...")
                     urls = core.search_via_api(query, max_count, serper_api_key)
                 else:
@@ -363,115 +464,212 @@ if start_button:
                                urls.append(u)
                                seen.add(urlparse(u).netloc)
             
-            if not urls:
-                st.error("URLの取得に失敗しました。")
-                if not serper_api_key:
-                    st.info("💡 対策: 検索エンジンにブロックされています。左側メニューの「Serper APIキー」を設定すると回避できます。")
-                st.stop()
-            
-            # 取得したURLリストを利用上限枠に合わせてカット
-            user_info = st.session_state.get("user_info", {})
-            current_usage = user_info.get("current_usage", 0)
-            max_usage = user_info.get("max_usage", 1000)
-            available = max_usage - current_usage
-            
-            if available <= 0:
-                st.error(f"本日の利用上限（{max_usage}件）に達しています。明日またご利用ください。")
-                st.stop()
-                
-            if len(urls) > available:
-                st.warning(f"本日の残り上限（{available}件）を超えるため、{available}件に制限して取得します。")
-                urls = urls[:available]
-                
-            # --- API消費処理（SaaS DBへ連絡） ---
-            manager_url = st.secrets.get("MANAGER_GAS_URL", "")
-            user_id = user_info.get("user_id")
-            password_used = st.session_state.get("password")
-            consume_count = len(urls)
-            
-            if manager_url and user_id and password_used and consume_count > 0:
-                try:
-                    resp = requests.post(manager_url, json={
-                        "action": "consume",
-                        "user_id": user_id,
-                        "password": password_used,
-                        "count": consume_count
-                    }, timeout=5)
-                    if resp.status_code == 200 and resp.json().get("success"):
-                        st.session_state["user_info"]["current_usage"] = resp.json().get("current_usage")
-                except Exception as e:
-                    pass # エラー時はとりあえず処理を続行
-            # ----------------------------------
-            
-            st.write(f"✅ {len(urls)} 件の対象URLを特定しました。")
+            if url_chunks is None:
+                if not urls:
+                    st.error("URLの取得に失敗しました。")
+                    if not serper_api_key:
+                        st.info("💡 対策: 検索エンジンにブロックされています。左側メニューの「Serper APIキー」を設定すると回避できます。")
+                    st.stop()
+                url_chunks = [urls]
+                total = len(urls)
+            # 目標件数モードでは、調べるサイト数を取得件数 x 上限倍率までに抑える
+            max_sites = int(max_count * overfetch_ratio) if target_mode else None
+            total = max(min(total, ledger.available()), 1)
             
             progress_bar = st.progress(0)
             data_container = st.empty()
+            queue_box = st.empty()
             df_preview = pd.DataFrame()
+            pool = get_scrape_pool()
+            user_key = ledger.user_id
+            # 残り利用枠が多いほど多く割り当てる（比は最大 4:1 に抑え、枠の少ないユーザーも待たせすぎない）
+            weight = scrape_pool.quota_weight(ledger.max_usage - ledger.current_usage)
+            breaker = core.HostCircuitBreaker()  # 応答しないサイトへの無駄な再試行を防ぐ
+            deadline = core.Deadline(job_budget_min * 60)
+            stats = get_path_stats()  # 業種ごとの「連絡先が載っているパス」の実績
+            cut_short = 0
+            processed = 0
+            probes_saved = 0
+            structured_sites = 0
+            structured_saved = 0
+            llm_saved = 0
+            llm_called = 0
+            reachable = 0
+            stopped = False
+            llm_cache = core.get_llm_cache() if openai_api_key else None
+            llm_before = llm_cache.stats() if llm_cache else None
             
-            for i, url in enumerate(urls, 1):
-                st.write(f"[{i}/{len(urls)}] {urlparse(url).netloc} を解析中...")
-                info = core.scrape_site(url, openai_api_key)
+            for chunk in url_chunks:
+                # 死んだドメインを事前に除外（利用枠は生きているURLの分だけ消費する）
+                chunk, dead_urls = core.prefilter_urls(chunk)
+                if dead_urls:
+                    st.write(f"🧹 接続できないドメイン {len(dead_urls)} 件を除外しました。")
+                if max_sites is not None:
+                    chunk = chunk[:max_sites - processed]
+                if not chunk:
+                    continue
+                reachable += len(chunk)
+
+                # 利用枠をローカル台帳で予約（実際に処理したサイト数だけを後で確定する）
+                reservation = ledger.reserve(len(chunk))
                 
-                if info["emails"] or info["phones"]:
-                    parts = []
-                    if info["emails"]: parts.append(f"メール等取得")
-                    if info["phones"]: parts.append(f"電話番号取得")
-                    st.write(f"  👉 取得成功: {' / '.join(parts)}")
-                    
-                    results.append(info)
+                if reservation.count <= 0:
+                    ledger.release(reservation)
+                    if not processed:
+                        st.error(f"本日の利用上限（{ledger.max_usage}件）に達しています。明日またご利用ください。")
+                        st.stop()
+                    st.warning("本日の利用上限に達したため、残りのURLは処理しませんでした。")
+                    break
                     
-                    # 途中結果のプレビュー表示（有効なもののみ）
-                    df_preview = pd.DataFrame([
-                        {
-                            "法人名": r["name"],
-                            "メール": " / ".join(r["emails"]),
-                            "電話": " / ".join(r["phones"]),
-                            "URL": r["url"]
-                        } for r in results
-                    ])
-                    data_container.dataframe(df_preview, use_container_width=True)
-                else:
-                    st.write("  ↳ ⚠️ 連絡先がひとつも見つかりませんでした（スキップ）")
+                if len(chunk) > reservation.count:
+                    st.warning(f"本日の残り上限（{reservation.count}件）を超えるため、{reservation.count}件に制限して取得します。")
+                    chunk = chunk[:reservation.count]
+                    stopped = True
                 
-                progress_bar.progress(i / len(urls))
-                time.sleep(core.DELAY)
+                st.write(f"✅ {len(chunk)} 件の対象URLを特定しました。")
+                # 全セッション共有のプールに預ける（同時接続数と同一ホストへのアクセスを全体で制限）
+                futures = [pool.submit(user_key, weight, core.scrape_site, url,
+                                       openai_api_key, breaker, deadline, stats, industry, llm_threshold)
+                           for url in chunk]
+                try:
+                    for url, fut in zip(chunk, futures):
+                        if target_mode and len(results) >= max_count:
+                            stopped = True
+                            break
+                        st.write(f"[{processed + 1}/{max_sites or total}] {urlparse(url).netloc} を解析中...")
+                        while not fut.done() and not deadline.expired():
+                            show_queue_position(queue_box, pool.queue_info(user_key))
+                            wait([fut], timeout=1)
+                        if not fut.done():
+                            cut_short += sum(1 for f in futures if not f.done())
+                            st.write("⏱️ 時間上限に達したため、残りのURLは処理しませんでした。")
+                            stopped = True
+                            break
+                        processed += 1
+                        try:
+                            info = fut.result()
+                        except Exception:
+                            st.write("  ↳ ⚠️ 解析中にエラーが発生しました（スキップ）")
+                            continue
+                        probes_saved += info.get("probes_saved", 0)
+                        if info.get("structured"):
+                            structured_sites += 1
+                            structured_saved += info["structured"]
+                        llm_saved += bool(info.get("llm_saved"))
+                        llm_called += bool(info.get("llm_called"))
+                        if info.get("cut_short"):
+                            cut_short += 1
+                    
+                        if info["emails"] or info["phones"]:
+                            parts = []
+                            if info["emails"]: parts.append(f"メール等取得")
+                            if info["phones"]: parts.append(f"電話番号取得")
+                            st.write(f"  👉 取得成功: {' / '.join(parts)}")
+                        
+                            results.append(info)
+                        
+                            # 途中結果のプレビュー表示（直近の有効なもののみ）
+                            df_preview = pd.DataFrame([
+                                {
+                                    "法人名": r["name"],
+                                    "メール": " / ".join(r["emails"]),
+                                    "電話": " / ".join(r["phones"]),
+                                    "URL": r["url"]
+                                } for r in results.tail()
+                            ])
+                            data_container.dataframe(df_preview, use_container_width=True)
+                        else:
+                            st.write("  ↳ ⚠️ 連絡先がひとつも見つかりませんでした（スキップ）")
+                    
+                        done_ratio = len(results) / total if target_mode else processed / total
+                        progress_bar.progress(min(done_ratio, 1.0))
+                finally:
+                    # まだ始まっていないタスクは取り消し、実際に解析したサイト数だけを利用実績として確定
+                    # （GASへの送信は裏でまとめて行う）
+                    for f in futures:
+                        f.cancel()
+                    ledger.commit(reservation, sum(1 for f in futures if not f.cancelled()))
+                if stopped or (max_sites is not None and processed >= max_sites) \
+                        or (target_mode and len(results) >= max_count):
+                    break
+            queue_box.empty()
+            stats.save()
+            if target_mode:
+                st.write(f"🎯 {processed} サイトを調べて、連絡先のある企業を {len(results)} 件見つけました。")
+                if len(results) < max_count:
+                    st.warning(f"目標の {max_count} 件に届きませんでした（調査上限 {max_sites} サイト、または検索結果の終わりに達しました）。")
+
+            if not reachable:
+                st.error("接続できるURLがありませんでした。")
+                st.stop()
             
             status.update(label="✅ 調査完了しました！", state="complete", expanded=False)
 
         # 3. 結果の表示と保存
         st.success(f"計 {len(results)} 件の情報を取得しました。")
+        if cut_short:
+            st.info(f"⏱️ 時間上限により {cut_short} サイトの調査を途中で打ち切りました。")
+        if probes_saved:
+            st.caption(f"📉 過去の実績から不要なページ取得を省略しました（平均 {probes_saved / max(processed, 1):.2f} リクエスト/サイト）")
+        if openai_api_key and processed:
+            st.caption(f"🧠 AI抽出を使ったサイト: {llm_called} / {processed} 件（{llm_called / processed:.0%}）")
+        if llm_cache:
+            # キャッシュはプロセス全体で共有なので、このジョブの前後の差分を表示する
+            c = llm_cache.stats()
+            hits = c["hits"] - llm_before["hits"]
+            misses = c["misses"] - llm_before["misses"]
+            if hits or misses:
+                st.caption(f"🧠 AI抽出キャッシュ: {hits} / {hits + misses} 件がキャッシュから取得"
+                           f"（約 {c['tokens_saved'] - llm_before['tokens_saved']} トークン節約）")
+        if structured_sites:
+            st.caption(f"🏷️ 構造化データ（JSON-LD 等）で {structured_sites} サイトの連絡先を確定し、"
+                       f"ページ取得 {structured_saved} 回・AI抽出 {llm_saved} 回を省略しました。")
         
-        # CSV保存（ローカル実行時用）
-        csv_path = core.save_csv(results, industry, region)
+        # CSV保存（ローカル実行時用）。連絡先の正規化・重複判定（同じ本部電話番号や制作会社のメールを判別）を
+        # しながら、結果ストアから少しずつ読み出してファイルに書く（全件を DataFrame や文字列にしない）
+        csv_path = core.export_path(industry, region)
+        with tempfile.NamedTemporaryFile(suffix=".jsonl", prefix="results_", delete=False) as tmp:
+            jsonl_path = tmp.name
+        dup_count, agency_count = core.export_results(results, csv_path, jsonl_path)
+        core.open_folder(csv_path)
+        if dup_count or agency_count:
+            st.info(f"🔁 重複候補 {dup_count} 件 / 制作会社等の共通連絡先 {agency_count} 件に印を付けました。")
         st.info(f"💾 CSVデータをエクスポートしました: {os.path.basename(csv_path)}")
         
         # Webブラウザからのダウンロードボタン（SaaSクラウド実行時用）
-        csv_data = df_preview.to_csv(index=False).encode("utf-8-sig")
-        st.download_button(
-            label="⬇️ CSVファイルをダウンロード",
-            data=csv_data,
-            file_name=os.path.basename(csv_path),
-            mime="text/csv",
-            type="primary"
-        )
+        with open(csv_path, "rb") as f:
+            st.download_button(
+                label="⬇️ CSVファイルをダウンロード",
+                data=f,
+                file_name=os.path.basename(csv_path),
+                mime="text/csv",
+                type="primary"
+            )
+        with open(jsonl_path, "rb") as f:
+            st.download_button(
+                label="⬇️ 再検証用データ (JSONL) をダウンロード",
+                data=f,
+                file_name=os.path.splitext(os.path.basename(csv_path))[0] + ".jsonl",
+                mime="application/json",
+                help="後日 `py business_research.py --refresh <ファイル>` で、連絡先の掲載ページだけを再確認できます。"
+            )
+        os.remove(jsonl_path)
         
         # スプレッドシート送信
         if gas_url:
             with st.spinner("📤 Googleスプレッドシートに送信中..."):
-                with_info = [r for r in results if r["emails"] or r["phones"]]
-                payload = {"results": with_info}
+                with_info = (r for r in results if r["emails"] or r["phones"])
                 try:
-                    import requests
-                    resp = requests.post(gas_url, json=payload, timeout=20)
-                    if resp.status_code == 200:
-                        st.balloons()
-                        st.success("✨ Googleスプレッドシートへ自動送信しました！")
-                    else:
-                        st.error(f"スプレッドシート送信に失敗しました (HTTP {resp.status_code})")
+                    core.post_results(gas_url, with_info)
+                    st.balloons()
+                    st.success("✨ Googleスプレッドシートへ自動送信しました！")
                 except Exception as e:
-                    st.error(f"送信時にエラーが発生しました: {e}")
+                    st.error(f"スプレッドシート送信に失敗しました: {e}")
 
-        # 詳細表示
+        # 詳細表示（直近の分だけ。全件はCSVで確認する）
         with st.expander("詳細データを表示"):
-            st.table(df_preview)
+            recent = results.tail()
+            st.caption(f"直近 {len(recent)} 件を表示しています（全 {len(results)} 件はCSVに保存済み）。")
+            st.dataframe(core.postprocess_results(recent)[["法人名", "メールアドレス", "電話番号", "URL"]],
+                         use_container_width=True)
+        results.close()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+import 時間ベンチマーク
+======================
+`import business_research` にかかる時間を別プロセスで複数回計測し、
+最小値が予算（ミリ秒）を超えていないか、重いライブラリを読み込んでいないかを確認する。
+（計測のぶれは他の負荷で遅くなる方向にしか出ないので、判定には最小値を使う）
+
+使い方:
+  py bench/import_time.py
+  py bench/import_time.py --budget-ms 80 --runs 10
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["business_research", "work_queue"]
+HEAVY = ["requests", "bs4", "lxml", "pandas"]  # 起動時に読み込んではいけないもの
+BUDGET_MS = 100
+
+
+def measure(module):
+    """-X importtime の出力から module の累積 import 時間（ミリ秒）を取り出す"""
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    total = None
+    for line in proc.stderr.splitlines():
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            total = int(parts[1]) / 1000
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return total, loaded
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="import 時間ベンチマーク")
+    p.add_argument("--runs", type=int, default=7)
+    p.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    args = p.parse_args(argv)
+
+    ok = True
+    for module in MODULES:
+        measure(module)  # 1回目は .pyc 生成を含むので捨てる
+        samples = []
+        loaded = []
+        for _ in range(args.runs):
+            ms, loaded = measure(module)
+            samples.append(ms)
+        median = statistics.median(samples)
+        status = "OK" if min(samples) <= args.budget_ms and not loaded else "NG"
+        ok = ok and status == "OK"
+        print(f"  [{status}] {module}: min {min(samples):.1f} ms (median {median:.1f}, budget {args.budget_ms:.0f})"
+              + (f"  heavy imports: {', '.join(loaded)}" if loaded else ""))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+LLM呼び出しの確信度ゲートの評価
+================================
+正解付きの合成コーパス（よくあるサイトの作り・紛らわしいケースを混ぜたもの）で、
+  - 常にLLMを呼ぶ場合（always-on）
+  - contact_confidence が閾値未満のときだけ呼ぶ場合（gated）
+の LLM 呼び出し率と正解率を比べる。ネットワークには一切アクセスしない。
+
+LLM はコーパスの正解を llm_accuracy の確率で返すシミュレーションで代用するため、
+always-on の正解率は「LLM がその精度で答えた場合」の値になる。
+
+使い方:
+  py bench/llm_gate.py
+  py bench/llm_gate.py --sites 2000 --thresholds 0.5 0.6 0.7 0.8 --llm-accuracy 0.95
+"""
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import business_research as core  # noqa: E402
+
+# (ケース名, 出現比率)
+CASES = [
+    ("clean_links", 0.30),      # mailto / tel リンクで1件ずつ（自社ドメイン）
+    ("clean_text", 0.20),       # 本文に1件ずつ（自社ドメイン）
+    ("free_mail", 0.10),        # 本文に gmail 等が1件（正解）
+    ("agency_footer", 0.10),    # 制作会社のメールだけが載っている（正解は別ページの本文）
+    ("many_emails", 0.10),      # recruit@ / info@ / 個人のメールが並ぶ
+    ("hq_and_store", 0.10),     # 本部と店舗の電話番号が並ぶ
+    ("nothing", 0.10),          # 連絡先はお問い合わせフォームの画像だけ
+]
+
+
+def phone(rnd):
+    return f"0{rnd.choice([3, 6])}-{rnd.randint(1000, 9999)}-{rnd.randint(1000, 9999)}"
+
+
+def make_site(i, case, rnd):
+    """1サイト分の (ホスト, ページHTMLのリスト, 正解メール, 正解電話) を作る"""
+    host = f"www.shop{i}.co.jp"
+    email = f"info@shop{i}.co.jp"
+    tel = phone(rnd)
+    if case == "clean_links":
+        pages = [f"<a href='mailto:{email}'>メール</a><a href='tel:{tel}'>{tel}</a>"]
+    elif case == "clean_text":
+        pages = [f"<p>E-mail: {email}</p><p>TEL {tel}</p>"]
+    elif case == "free_mail":
+        email = f"shop{i}.owner@gmail.com"
+        pages = [f"<p>ご予約: {email}</p><p>TEL {tel}</p>"]
+    elif case == "agency_footer":
+        pages = [f"<p>TEL {tel}</p><footer>制作: design@webagency{i % 7}.jp</footer>",
+                 f"<p>お問い合わせは {email.replace('@', ' (at) ')} まで</p>"]
+    elif case == "many_emails":
+        pages = [f"<p>採用: recruit@shop{i}.co.jp</p><p>代表: {email}</p>"
+                 f"<p>担当 yamada@shop{i}.co.jp</p><a href='tel:{tel}'>{tel}</a>"]
+    elif case == "hq_and_store":
+        hq = phone(rnd)
+        pages = [f"<a href='mailto:{email}'>mail</a><p>本部 {hq}</p><p>当店 {tel}</p>"]
+    else:
+        # 正解はあるが画像内にしかない（LLMなら読めた想定）
+        pages = ["<p>お問い合わせはフォームから</p><img src='tel.png'>"]
+    return host, pages, email, tel
+
+
+def make_corpus(n, seed=0):
+    rnd = random.Random(seed)
+    names = [c for c, _ in CASES]
+    weights = [w for _, w in CASES]
+    return [(case,) + make_site(i, case, rnd) for i, case in enumerate(rnd.choices(names, weights, k=n))]
+
+
+def evaluate(corpus, threshold, llm_accuracy, seed=1):
+    """閾値 threshold で scrape_site と同じ判定をしたときの (LLM呼び出し数, 正解数, ケース別正解数)
+
+    LLM が正解するかどうかはサイトごとに固定（閾値を変えても同じサイトでは同じ答えを返す）。
+    """
+    calls = correct = 0
+    by_case = {}
+    for case, host, pages, truth_email, truth_phone in corpus:
+        emails, phones = {}, {}
+        for html in pages:
+            page_emails, page_phones = core.extract_contacts(html, core.make_soup(html))
+            core.merge_found(emails, page_emails)
+            core.merge_found(phones, page_phones)
+        if core.contact_confidence(emails, phones, host) < threshold:
+            calls += 1
+            ok = random.Random(f"{seed}:{host}").random() < llm_accuracy
+            core.apply_llm_result(emails, phones, {"email": truth_email if ok else "",
+                                                   "phone": truth_phone if ok else ""})
+        # scrape_site と同じく先頭から3件・2件を出力とみなす
+        hit = truth_email in sorted(emails)[:3] and truth_phone in sorted(phones)[:2]
+        correct += hit
+        by_case.setdefault(case, [0, 0])
+        by_case[case][0] += hit
+        by_case[case][1] += 1
+    return calls, correct, by_case
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="LLM呼び出しの確信度ゲートの評価（オフライン）")
+    p.add_argument("--sites", type=int, default=1000)
+    p.add_argument("--thresholds", type=float, nargs="+", default=[0.5, core.LLM_CONFIDENCE_THRESHOLD, 0.9])
+    p.add_argument("--llm-accuracy", type=float, default=0.95, help="シミュレーションするLLMの正解率")
+    args = p.parse_args(argv)
+
+    corpus = make_corpus(args.sites)
+    n = len(corpus)
+    base_calls, base_correct, base_cases = evaluate(corpus, 2.0, args.llm_accuracy)
+    print(f"  sites: {n}  llm accuracy (simulated): {args.llm_accuracy:.0%}")
+    print(f"  {'mode':<16} {'llm calls':>10} {'call rate':>10} {'accuracy':>9} {'vs always':>10}")
+    print(f"  {'always-on':<16} {base_calls:>10} {base_calls / n:>10.0%} {base_correct / n:>9.1%} {'':>10}")
+    for t in args.thresholds:
+        calls, correct, cases = evaluate(corpus, t, args.llm_accuracy)
+        print(f"  {f'gated @ {t:.2f}':<16} {calls:>10} {calls / n:>10.0%} {correct / n:>9.1%} "
+              f"{(correct - base_correct) / n:>+10.1%}")
+
+    calls, correct, cases = evaluate(corpus, core.LLM_CONFIDENCE_THRESHOLD, args.llm_accuracy)
+    print(f"  per case @ {core.LLM_CONFIDENCE_THRESHOLD:.2f} (gated / always-on):")
+    for case, _ in CASES:
+        if case in cases:
+            g, total = cases[case]
+            print(f"    {case:<14} {g / total:6.1%} / {base_cases[case][0] / total:6.1%}  (n={total})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+"""
+同時利用の負荷試験
+==================
+app.py のリサーチの流れ（ログイン -> 検索 -> スクレイピング -> 結果表示）を、
+N 人の仮想ユーザーで同時に実行し、何人までなら1インスタンスで捌けるかを測る。
+
+外部には一切アクセスしない:
+  - マネージャーGAS（login / consume）と Serper API はローカルのスタブサーバー
+  - スクレイピング先は、ローカルのポートごとに立てたフィクスチャサイト
+  - アプリは本番と同じく streamlit のサーバー1プロセスで起動し、仮想ユーザーはブラウザの代わりに
+    WebSocket（/_stcore/stream）でそのサーバーにセッションを張る（全員が1つのプロセスを共有する）
+  - CPU・メモリ（RSS）・ソケット数は、そのアプリサーバーのプロセスだけを計測する
+  - 結果のCSVは一時ディレクトリに書き出し、終了時に消す
+
+使い方:
+  py bench/loadtest.py
+  py bench/loadtest.py --users 1 2 4 8 --sites 120 --count 10 --output capacity.json
+  py bench/loadtest.py --users 1 4 --compare capacity_prev.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import business_research as core  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "app.py")
+SAMPLE_SECONDS = 0.2
+
+
+# ===== スタブサーバー / フィクスチャサイト =====
+def fixture_page(i, path):
+    """サイト番号とパスから決まった内容のページを返す（連絡先のないサイト・ページも混ぜる）"""
+    kind = i % 4
+    if path in ("", "/"):
+        body = f"<title>テスト株式会社{i}</title><p>ようこそ</p>"
+        if kind == 0:
+            body += f"<p>TEL 03-{1000 + i:04d}-{2000 + i:04d}</p><a href='mailto:info@site{i}.fixture-shop.jp'>mail</a>"
+        return 200, body
+    if path == "/contact" and kind in (1, 2):
+        return 200, f"<p>お問い合わせ: 06-{3000 + i:04d}-{4000 + i:04d}</p>"
+    if path == "/company" and kind == 1:
+        return 200, f"<p>info@site{i}.fixture-shop.jp</p>"
+    return 404, "<p>not found</p>"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    site_no = 0
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        status, body = fixture_page(self.site_no, self.path.rstrip("/") or "")
+        data = f"<html><body>{body}</body></html>".encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """マネージャーGAS（/manager）と Serper API（/serper）のスタブ"""
+    site_urls = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path.startswith("/serper"):
+            # クエリごとに開始位置をずらし、ユーザー間で一部のサイトが重なるようにする
+            urls = self.site_urls
+            start = sum(map(ord, payload.get("q", ""))) % len(urls)
+            page = payload.get("page", 1) - 1
+            num = payload.get("num", 100)
+            picked = [urls[(start + page * num + k) % len(urls)] for k in range(num)] if page * num < len(urls) else []
+            result = {"organic": [{"link": u} for u in picked]}
+        elif payload.get("action") == "login":
+            result = {"success": True, "gas_url": "", "current_usage": 0, "max_usage": 100000}
+        else:
+            result = {"success": True}
+        data = json.dumps(result).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_fixtures(n_sites, latency):
+    """ポートごとに1サイトを立てる（URLのホスト:ポートが別ドメインとして扱われる）"""
+    servers, urls = [], []
+    for i in range(n_sites):
+        handler = type(f"Site{i}", (FixtureHandler,), {"site_no": i, "latency": latency})
+        server = serve(handler)
+        servers.append(server)
+        urls.append(f"http://127.0.0.1:{server.server_address[1]}/")
+    StubHandler.site_urls = urls
+    stub = serve(StubHandler)
+    return servers, stub
+
+
+# ===== 計測（アプリサーバー1プロセス） =====
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def cpu_seconds(pid):
+    """プロセス pid の累積 CPU 時間（user + system 秒）。取れなければ 0"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def rss_mb(pid):
+    """プロセス pid の RSS（MB）。取れなければ 0"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def socket_count(pid):
+    """プロセス pid が開いているソケット数（Linux 以外では 0）"""
+    try:
+        fds = os.listdir(f"/proc/{pid}/fd")
+    except OSError:
+        return 0
+    n = 0
+    for fd in fds:
+        try:
+            if os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:"):
+                n += 1
+        except OSError:
+            pass
+    return n
+
+
+class Sampler:
+    """試行中の、アプリサーバーの RSS とソケット数のピークを一定間隔で記録する"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.rss_peak = rss_mb(pid)
+        self.sockets_peak = socket_count(pid)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_SECONDS):
+            self.rss_peak = max(self.rss_peak, rss_mb(self.pid))
+            self.sockets_peak = max(self.sockets_peak, socket_count(self.pid))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)
+    return values[k]
+
+
+# ===== アプリサーバー =====
+def server_main(args):
+    """--server で起動された子プロセス: スタブ向けに設定を差し替えてから app.py を streamlit で配信する
+
+    `streamlit run app.py --server.headless true` と同じ起動処理（bootstrap.run）を使う。
+    検索APIのURLなどはモジュール変数なので、同じプロセスで差し替えてから起動する。
+    """
+    from streamlit.web import bootstrap
+
+    core.SERPER_URL = args.stub + "/serper"
+    core.STATS_PATH = ""
+    if args.no_delay:
+        core.DELAY = 0
+    flags = {
+        "server.headless": True,
+        "server.address": "127.0.0.1",
+        "server.port": args.port,
+        "server.fileWatcherType": "none",
+        "browser.gatherUsageStats": False,
+    }
+    bootstrap.load_config_options(flags)
+    bootstrap.run(APP_PATH, False, [], flags)
+    return 0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(stub_url, no_delay, work_dir, timeout=60):
+    """アプリサーバーを1つ起動し、応答するまで待つ。(Popen, ポート) を返す
+
+    シークレット（マネージャーGASのURL）は work_dir/.streamlit/secrets.toml に置き、
+    カレントディレクトリと HOME を work_dir にして、結果CSVもそこに書き出させる。
+    """
+    os.makedirs(os.path.join(work_dir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(work_dir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write(f'MANAGER_GAS_URL = "{stub_url}/manager"\nGAS_URL = ""\n')
+    port = free_port()
+    cmd = [sys.executable, os.path.abspath(__file__), "--server", "--stub", stub_url, "--port", str(port)]
+    if no_delay:
+        cmd.append("--no-delay")
+    env = dict(os.environ, HOME=work_dir, USERPROFILE=work_dir)
+    proc = subprocess.Popen(cmd, cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"app server exited with {proc.returncode}")
+        try:
+            with urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=2) as r:
+                if r.status == 200:
+                    return proc, port
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("app server did not start")
+
+
+# ===== 仮想ユーザー（WebSocket セッション） =====
+class Session:
+    """ブラウザの代わりに /_stcore/stream へ接続し、ウィジェット操作と再実行を送る1セッション"""
+
+    def __init__(self, ws, timeout):
+        self.ws = ws
+        self.timeout = timeout
+        self.states = {}     # ウィジェットID -> 送る値（WidgetState）
+        self.widgets = {}    # ラベル -> (種類, 要素の proto)
+        self.texts = []      # 直近の実行で表示された st.success などの本文
+        self.errors = []     # 直近の実行で出た例外
+
+    def set(self, label, value):
+        """ラベルで指定したウィジェットに値を入れる（次の run() で送られる）"""
+        kind, w = self.widget(label)
+        state = self.states.setdefault(w.id, _widget_state(w.id))
+        if kind == "number_input":
+            if w.data_type == w.INT:
+                state.int_value = int(value)
+            else:
+                state.double_value = float(value)
+        elif kind == "checkbox":
+            state.bool_value = bool(value)
+        else:
+            state.string_value = str(value)
+
+    def widget(self, label):
+        for text, item in self.widgets.items():
+            if label in text:
+                return item
+        raise KeyError(f"widget not found: {label}")
+
+    def run(self, click=None):
+        """スクリプトを再実行し、最後まで終わるのを待つ。click はボタンのラベル"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        states = list(self.states.values())
+        if click:
+            _, w = self.widget(click)
+            trigger = _widget_state(w.id)
+            trigger.trigger_value = True
+            states.append(trigger)
+        msg.rerun_script.widget_states.widgets.extend(states)
+        self.ws.send(msg.SerializeToString())
+
+        self.widgets, self.texts, self.errors = {}, [], []
+        done = {ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_WITH_COMPILE_ERROR}
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(self.ws.recv(timeout=self.timeout))
+            kind = fwd.WhichOneof("type")
+            if kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                self._element(fwd.delta.new_element)
+            elif kind == "script_finished":
+                if fwd.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    # st.rerun() による再実行。次の実行の表示だけを残す
+                    self.widgets, self.texts, self.errors = {}, [], []
+                elif fwd.script_finished in done:
+                    return
+
+    def _element(self, el):
+        kind = el.WhichOneof("type")
+        w = getattr(el, kind)
+        if kind == "exception":
+            self.errors.append(w.message)
+        elif kind == "alert":
+            self.texts.append(w.body)
+        elif hasattr(w, "id") and hasattr(w, "label") and w.id:
+            self.widgets[w.label] = (kind, w)
+
+
+def _widget_state(widget_id):
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    state = WidgetState()
+    state.id = widget_id
+    return state
+
+
+def virtual_user(no, port, count, timeout):
+    """1人分のセッション: ログインしてから検索・調査を1回実行し、所要時間などを返す"""
+    from websockets.sync.client import connect
+
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    with connect(url, subprotocols=["streamlit"], max_size=None, open_timeout=timeout) as ws:
+        s = Session(ws, timeout)
+        s.run()
+        s.set("ユーザーID", f"load{no}")
+        s.set("パスワード", "password")
+        s.run(click="ログイン")
+        s.set("🎯 業種", f"業種{no % 5}")
+        s.set("📍 地域", f"地域{no}")
+        s.set("Serper APIキー", "stub")
+        s.set("取得件数", count)
+        t = time.perf_counter()
+        s.run(click="リサーチを開始する")
+        elapsed = time.perf_counter() - t
+    ok = not s.errors and any(t.startswith("計 ") for t in s.texts)
+    return {"seconds": elapsed, "ok": ok, "error": s.errors[0] if s.errors else ""}
+
+
+def run_level(users, server, port, count, timeout):
+    """同時に users 人のセッションを同じアプリサーバーに流し、サーバー側の負荷と所要時間を測る"""
+    results = [None] * users
+
+    def user(i):
+        try:
+            results[i] = virtual_user(i, port, count, timeout)
+        except Exception as e:
+            results[i] = {"seconds": None, "ok": False, "error": repr(e)}
+
+    cpu0 = cpu_seconds(server.pid)
+    wall0 = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    with Sampler(server.pid) as sampler:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    wall = time.perf_counter() - wall0
+
+    times = [r["seconds"] for r in results if r["ok"]]
+    return {
+        "users": users,
+        "ok": len(times),
+        "errors": [r["error"] for r in results if not r["ok"]][:3],
+        "p50_s": percentile(times, 50),
+        "p95_s": percentile(times, 95),
+        "max_s": max(times) if times else None,
+        "wall_s": wall,
+        "sites_per_s": len(times) * count / wall if wall else None,
+        "cpu_pct": 100 * (cpu_seconds(server.pid) - cpu0) / wall if wall else None,
+        "rss_peak_mb": sampler.rss_peak,
+        "sockets_peak": sampler.sockets_peak,
+    }
+
+
+def release_name():
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def fmt(v, spec=".2f"):
+    return "-" if v is None else format(v, spec)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="同時利用の負荷試験（オフライン）")
+    p.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8], help="同時ユーザー数（段階ごと）")
+    p.add_argument("--sites", type=int, default=60, help="フィクスチャサイト数")
+    p.add_argument("--count", type=int, default=10, help="1ユーザーあたりの取得件数")
+    p.add_argument("--latency", type=float, default=0.05, help="フィクスチャサイトの応答遅延（秒）")
+    p.add_argument("--no-delay", action="store_true", help="検索・サイト間の待ち時間（DELAY）を0にする")
+    p.add_argument("--timeout", type=float, default=600, help="1ジョブのタイムアウト秒")
+    p.add_argument("--output", default="", help="容量曲線を書き出す JSON ファイル")
+    p.add_argument("--compare", default="", help="比較する過去の容量曲線 JSON")
+    # 以下はアプリサーバーの子プロセス用
+    p.add_argument("--server", action="store_true", help=argparse.SUPPRESS)
+    p.add_argument("--stub", help=argparse.SUPPRESS)
+    p.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+    if args.server:
+        return server_main(args)
+
+    _, stub = start_fixtures(args.sites, args.latency)
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    work_dir = tempfile.TemporaryDirectory(prefix="loadtest-")  # シークレットと結果CSVの置き場所
+    server, port = start_server(stub_url, args.no_delay, work_dir.name)
+
+    levels = []
+    try:
+        print(f"  release: {release_name()}  sites: {args.sites}  count/user: {args.count}  "
+              f"server pid: {server.pid}  idle rss: {rss_mb(server.pid):.0f} MB")
+        print(f"  {'users':>5} {'ok':>4} {'p50':>7} {'p95':>7} {'max':>7} {'sites/s':>8} {'cpu%':>6} {'rss MB':>7} {'sock':>5}")
+        for users in args.users:
+            r = run_level(users, server, port, args.count, args.timeout)
+            levels.append(r)
+            print(f"  {users:>5} {r['ok']:>4} {fmt(r['p50_s']):>7} {fmt(r['p95_s']):>7} {fmt(r['max_s']):>7} "
+                  f"{fmt(r['sites_per_s']):>8} {fmt(r['cpu_pct'], '.0f'):>6} {r['rss_peak_mb']:>7.0f} {r['sockets_peak']:>5}")
+            for e in r["errors"]:
+                print(f"        [!] {e}")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        work_dir.cleanup()
+
+    curve = {"release": release_name(), "sites": args.sites, "count": args.count,
+             "latency": args.latency, "no_delay": args.no_delay, "levels": levels}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(curve, f, ensure_ascii=False, indent=2)
+        print(f"  capacity curve: {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            prev = {lv["users"]: lv for lv in json.load(f)["levels"]}
+        print(f"  p95 vs {args.compare}:")
+        for lv in levels:
+            old = prev.get(lv["users"])
+            if old and old.get("p95_s") and lv["p95_s"]:
+                print(f"  {lv['users']:>5} users: {old['p95_s']:.2f}s -> {lv['p95_s']:.2f}s "
+                      f"({lv['p95_s'] / old['p95_s']:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+後処理ベンチマーク
+==================
+postprocess_results（pandas ベクトル演算）と、従来どおり1行ずつ Python で処理する方式を
+同じ合成データで比較する。
+
+使い方:
+  py bench/postprocess.py
+  py bench/postprocess.py --rows 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import business_research as core  # noqa: E402
+
+
+def make_results(n, seed=0):
+    """フランチャイズ本部の電話・制作会社のメールが混ざった合成データ"""
+    rnd = random.Random(seed)
+    hq_phones = [f"03{rnd.randint(10000000, 99999999)}" for _ in range(n // 200 + 1)]
+    agencies = [f"agency{i}.co.jp" for i in range(n // 500 + 1)]
+    results = []
+    for i in range(n):
+        site = f"shop{i}.example.jp"
+        emails, phones = [], []
+        r = rnd.random()
+        if r < 0.1:
+            phones.append(rnd.choice(hq_phones))
+        elif r < 0.8:
+            phones.append(f"0{rnd.randint(3, 9)}-{rnd.randint(1000, 9999)}-{rnd.randint(1000, 9999)}")
+        r = rnd.random()
+        if r < 0.05:
+            emails.append(f"info{i}@{rnd.choice(agencies)}")
+        elif r < 0.6:
+            emails.append(f"info@{site}")
+        results.append({"name": f"店舗{i}", "url": f"https://{site}/", "emails": emails, "phones": phones})
+    return results
+
+
+def per_row(results):
+    """従来方式: dict のリストを1行ずつ処理する"""
+    by_phone = defaultdict(set)
+    by_domain = defaultdict(set)
+    rows = []
+    for r in results:
+        site = r["url"].split("/")[2].lower()
+        phones = [p for p in (core.clean_phone(x) for x in r["phones"]) if p]
+        emails = [e.strip().lower() for e in r["emails"]]
+        for p in phones:
+            by_phone[p].add(site)
+        for e in emails:
+            by_domain[e.split("@")[-1]].add(site)
+        rows.append((r["name"], emails, phones, r["url"], site))
+    out = []
+    for name, emails, phones, url, site in rows:
+        dup = any(len(by_phone[p]) > 1 for p in phones) or any(
+            len(by_domain[e.split("@")[-1]]) > 1 and e.split("@")[-1] not in core.FREE_MAIL_DOMAINS
+            for e in emails)
+        agency = any(
+            len(by_domain[e.split("@")[-1]]) >= core.AGENCY_MIN_SITES and not site.endswith(e.split("@")[-1])
+            for e in emails)
+        out.append({"法人名": name, "メールアドレス": " / ".join(emails), "電話番号": " / ".join(phones),
+                    "URL": url, "重複候補": dup, "共通連絡先": agency})
+    out.sort(key=lambda x: (not (x["メールアドレス"] or x["電話番号"]), x["法人名"]))
+    return out
+
+
+def timeit(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - t)
+    return best, out
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="後処理ベンチマーク")
+    p.add_argument("--rows", type=int, default=100_000)
+    args = p.parse_args(argv)
+
+    results = make_results(args.rows)
+    t_vec, df = timeit(core.postprocess_results, results)
+    t_row, rows = timeit(per_row, results)
+
+    print(f"  rows: {args.rows}")
+    print(f"  per-row (python)     : {t_row * 1000:8.1f} ms  dup={sum(r['重複候補'] for r in rows)}")
+    print(f"  postprocess (pandas) : {t_vec * 1000:8.1f} ms  dup={int(df['重複候補'].sum())}")
+    print(f"  ratio                : {t_row / t_vec:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
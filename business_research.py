@@ -7,10 +7,14 @@
 
 使い方:
   py business_research.py
+  py business_research.py --industries 美容院 飲食店 --regions 渋谷区 新宿区 --count 50
+  py business_research.py --grid queries.csv --urls urls.txt --output result.csv
+  py business_research.py --industries 美容院 --regions 東京 大阪 --count 2000 --shard
+  py business_research.py --refresh result.jsonl
+  py business_research.py --industries 美容院 --regions 渋谷区 --archive archive/
+  py business_research.py --reextract archive/ --output result_v2.csv
 """
 
-import requests
-from bs4 import BeautifulSoup
 import csv
 import re
 import time
@@ -19,6 +23,14 @@ import sys
 import io
 import json
 import base64
+import hashlib
+import socket
+import queue
+from array import array
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin, urlparse, parse_qs, unquote
 from datetime import datetime
 
@@ -39,6 +51,42 @@ HEADERS = {
 }
 TIMEOUT = 10
 DELAY = 1.5
+SERPER_URL = "https://google.serper.dev/search"
+LLM_MODEL = "gpt-4o-mini"
+LLM_PROMPT_VERSION = 1   # プロンプトを変えたら上げる（古いキャッシュを使わないため）
+LLM_CONFIDENCE_THRESHOLD = 0.7  # 決定的な抽出結果の確信度がこれ未満のときだけLLMを呼ぶ（1超で常に呼ぶ）
+LLM_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite")
+DNS_WORKERS = 32       # 事前DNS解決の同時実行数
+CONNECT_TIMEOUT = 3    # 事前到達確認（TCP接続）のタイムアウト秒
+BREAKER_THRESHOLD = 2  # 同じホストで致命的な失敗がこの回数続いたら以降のアクセスを止める
+REQUEST_BUDGET = 15    # 1リクエスト（本文の読み込みまで）の合計秒数上限
+SITE_BUDGET = 40       # 1サイトあたりの合計秒数上限
+DEADLINE_MARGIN = 10   # 残り時間がこれを切ったら優先度の低いパスは試さない
+PAGE_GONE_STATUSES = (404, 410)  # 再検証でこの応答ならページが無くなったとみなす
+HIGH_VALUE_PATHS = ("", "/contact")
+PROBE_PATHS = ["", "/contact", "/about", "/company", "/access"]
+STATS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "path_stats.json")
+YIELD_MIN_SAMPLES = 30   # この回数以上試したパスだけ実績で判断する
+YIELD_THRESHOLD = 0.05   # 残りのパスで足りない連絡先が見つかる見込みがこれ未満なら打ち切る
+AGENCY_MIN_SITES = 3   # 同じメールドメインがこの数以上の別サイトに出たら制作会社等の共通連絡先とみなす
+
+FREE_MAIL_DOMAINS = {
+    "gmail.com", "yahoo.co.jp", "ymail.ne.jp", "icloud.com", "me.com",
+    "outlook.com", "outlook.jp", "hotmail.com", "hotmail.co.jp", "live.jp",
+    "docomo.ne.jp", "ezweb.ne.jp", "au.com", "softbank.ne.jp", "i.softbank.jp",
+}
+DUMMY_PHONES = ["0000000000", "0123456789", "00000000000"]
+STORE_MAX_IN_MEMORY = 2000  # 結果ストアがメモリに保持する最大件数（超えたらディスクへ退避）
+GAS_CHUNK = 500             # スプレッドシートへ一度に送る件数
+GAS_FIELDS = ("name", "url", "emails", "phones", "query")  # スプレッドシートへ送る項目
+PREVIEW_ROWS = 200          # 途中経過プレビューに表示する件数
+URL_CHUNK = 200          # URLリストファイルを一度に処理する件数
+SEARCH_CHUNK = 10        # 検索結果をスクレイピングへ流す単位
+OVERFETCH_RATIO = 3.0    # 目標件数モードで調べるサイト数の上限（目標件数の何倍まで）
+REGIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regions_jp.json")
+SHARD_WORKERS = 4        # 地域を分割したときに同時に実行する検索の数
+SHARD_MIN_COUNT = 20     # 分割した1地域あたりに取りに行く最低件数（Bing / DuckDuckGo の場合）
+POOL_SIZE = 32  # 共有コネクションプールの最大接続数
 
 EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+\-]+@[a-zA-Z0-9.\-]+\.[a-zA-Z]{2,}')
 PHONE_RE = re.compile(r'(?:0\d{1,4}[-\s]?\d{1,4}[-\s]?\d{3,4})')
@@ -74,6 +122,35 @@ SKIP_DOMAINS = [
 ]
 
 
+# requests / bs4 / lxml は読み込みが重いため、初回使用時に import する
+# （URL1件の確認やジョブ再開など短いCLI実行の起動を速くするため）
+_session = None
+_session_lock = threading.Lock()
+_llm_cache = None
+
+
+def make_soup(html):
+    """HTMLをパースする（bs4 + lxml は初回呼び出し時に読み込む）"""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "lxml")
+
+
+def get_session():
+    """プロセス内で共有するHTTPセッション（コネクションプール）を返す"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            s = requests.Session()
+            s.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _session = s
+    return _session
+
+
 def banner():
     print("")
     print("=" * 55)
@@ -135,19 +212,12 @@ def skip_url(url):
     return any(s in domain for s in SKIP_DOMAINS)
 
 
-def search_via_api(query, count=20, api_key=""):
-    """Serper APIを使ってGoogle検索を確実に実行"""
-    urls = []
+def iter_api_pages(query, api_key, max_pages=10):
+    """Serper APIの検索結果を1ページ（最大100件）ずつ、必要になった分だけ取得して返す"""
     seen = set()
-    url = "https://google.serper.dev/search"
-    
-    print(f"  [*] Serper API (Target: {count})")
-    
-    # 除外されて件数が減ることを考慮し、最大10ページ(約1000件分)まで検索して補填する
-    for page in range(10): 
-        if len(urls) >= count:
-            break
-            
+    found = 0
+
+    for page in range(max_pages):
         payload = json.dumps({
           "q": query,
           "gl": "jp",
@@ -162,47 +232,54 @@ def search_via_api(query, count=20, api_key=""):
         
         try:
             time.sleep(DELAY)
-            resp = requests.post(url, headers=headers, data=payload, timeout=20)
-            if resp.status_code == 200:
-                data = resp.json()
-                if "organic" in data and len(data["organic"]) > 0:
-                    for item in data["organic"]:
-                        href = item.get("link", "")
-                        if href.startswith("http") and not skip_url(href):
-                            domain = urlparse(href).netloc
-                            if domain not in seen:
-                                seen.add(domain)
-                                urls.append(href)
-                                if len(urls) >= count:
-                                    break # 目標件数に達したら即終了
-                else:
-                    break # もう検索結果がなければ終了
-                
-                print(f"  [*] API: {len(urls)} URLs so far...")
-            else:
+            resp = get_session().post(SERPER_URL, headers=headers, data=payload, timeout=20)
+            if resp.status_code != 200:
                 print(f"  [!] API: HTTP {resp.status_code} - {resp.text}")
-                break
+                return
+            data = resp.json()
         except Exception as e:
             print(f"  [!] API Error: {e}")
-            break
+            return
+
+        if not data.get("organic"):
+            return # もう検索結果がなければ終了
+        urls = []
+        for item in data["organic"]:
+            href = item.get("link", "")
+            if href.startswith("http") and not skip_url(href):
+                domain = urlparse(href).netloc
+                if domain not in seen:
+                    seen.add(domain)
+                    urls.append(href)
+        found += len(urls)
+        print(f"  [*] API: {found} URLs so far...")
+        yield urls
+
+
+def search_via_api(query, count=20, api_key=""):
+    """Serper APIを使ってGoogle検索を確実に実行"""
+    urls = []
+    print(f"  [*] Serper API (Target: {count})")
+    
+    # 除外されて件数が減ることを考慮し、最大10ページ(約1000件分)まで検索して補填する
+    for page in iter_api_pages(query, api_key):
+        urls.extend(page)
+        if len(urls) >= count:
+            break # 目標件数に達したら即終了
             
     return urls[:count]
 
 
-def search_bing(query, count=20):
-    """Bing検索でURL取得"""
-    urls = []
+def iter_bing_pages(query, max_pages=10):
+    """Bing検索の結果を1ページ（10件）ずつ、必要になった分だけ取得して返す"""
     seen = set()
+    found = 0
 
-    # 最大10ページ(約100件分)まで検索して補填する
-    for page in range(10):
-        if len(urls) >= count:
-            break
-
+    for page in range(max_pages):
         offset = page * 10
         try:
             time.sleep(DELAY)
-            resp = requests.get(
+            resp = get_session().get(
                 "https://www.bing.com/search",
                 params={"q": query, "first": offset + 1, "count": 10},
                 headers=HEADERS,
@@ -212,11 +289,12 @@ def search_bing(query, count=20):
                 print(f"  [!] Bing p{page+1}: HTTP {resp.status_code}")
                 continue
 
-            soup = BeautifulSoup(resp.text, "lxml")
+            soup = make_soup(resp.text)
             items = soup.select("li.b_algo")
             if not items:
-                break # 検索結果がなくなったら終了
+                return # 検索結果がなくなったら終了
 
+            urls = []
             for li in items:
                 a = li.find("a", href=True)
                 if a:
@@ -226,14 +304,25 @@ def search_bing(query, count=20):
                         if domain not in seen:
                             seen.add(domain)
                             urls.append(href)
-                            if len(urls) >= count:
-                                break # 目標件数に達したら即終了
 
-            print(f"  [*] Bing p{page+1}: {len(urls)} URLs so far...")
+            found += len(urls)
+            print(f"  [*] Bing p{page+1}: {found} URLs so far...")
 
         except Exception as e:
             print(f"  [!] Bing error: {e}")
-            break
+            return
+        yield urls
+
+
+def search_bing(query, count=20):
+    """Bing検索でURL取得"""
+    urls = []
+
+    # 最大10ページ(約100件分)まで検索して補填する
+    for page in iter_bing_pages(query):
+        urls.extend(page)
+        if len(urls) >= count:
+            break # 目標件数に達したら即終了
 
     return urls[:count]
 
@@ -244,7 +333,7 @@ def search_ddg(query, count=20):
     seen = set()
     try:
         time.sleep(DELAY)
-        resp = requests.get(
+        resp = get_session().get(
             "https://html.duckduckgo.com/html/",
             params={"q": query},
             headers=HEADERS,
@@ -253,7 +342,7 @@ def search_ddg(query, count=20):
         if resp.status_code != 200:
             return urls
 
-        soup = BeautifulSoup(resp.text, "lxml")
+        soup = make_soup(resp.text)
         for a in soup.select("a.result__a[href]"):
             href = a.get("href", "")
             if "uddg=" in href:
@@ -274,6 +363,226 @@ def search_ddg(query, count=20):
     return urls[:count]
 
 
+# ===== 検索結果のストリーミング =====
+def iter_ddg_pages(query, count=30):
+    """DuckDuckGo の検索結果を1ページとして返す（読み進められたときに初めて検索する）"""
+    yield search_ddg(query, count)
+
+
+def iter_search_urls(query, serper_api_key=""):
+    """検索結果のURLを1件ずつ返す。次のページは呼び出し側が読み進めたときに初めて取得する
+
+    APIキーがあれば Serper API、なければ Bing を読み切った後に DuckDuckGo で補う。
+    """
+    if serper_api_key:
+        sources = [iter_api_pages(query, serper_api_key)]
+    else:
+        sources = [iter_bing_pages(query), iter_ddg_pages(query)]
+    seen = set()
+    for pages in sources:
+        for page in pages:
+            for u in page:
+                domain = urlparse(u).netloc
+                if domain not in seen:
+                    seen.add(domain)
+                    yield u
+
+
+def prefetch(iterable, size=SEARCH_CHUNK, batch=False):
+    """iterable を別スレッドで最大 size 件まで先読みする（検索の待ち時間をスクレイピングと重ねる）
+
+    batch=True なら、その時点で読み終わっている分（1〜size 件）をリストにまとめて返す。
+    呼び出し側が読むのをやめたら、先読みスレッドもそれ以上は取得しない。
+    """
+    buf = queue.Queue(maxsize=size)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buf.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as e:
+            print(f"  [!] prefetch error: {e}")
+        finally:
+            put(done)
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            item = buf.get()
+            if item is done:
+                return
+            if not batch:
+                yield item
+                continue
+            items = [item]
+            while len(items) < size:
+                try:
+                    item = buf.get_nowait()
+                except queue.Empty:
+                    break
+                if item is done:
+                    yield items
+                    return
+                items.append(item)
+            yield items
+    finally:
+        stop.set()
+
+
+def chunked(iterable, size):
+    """iterable を size 件ずつのリストにまとめて返す"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ===== 地域の分割（検索の深さの上限を超えて集める） =====
+_regions = None
+
+
+def load_regions():
+    """同梱の 都道府県 -> 市区 / 政令指定都市 -> 区 の表を読み込む（初回だけ）"""
+    global _regions
+    if _regions is None:
+        with open(REGIONS_PATH, "r", encoding="utf-8") as f:
+            _regions = json.load(f)
+    return _regions
+
+
+def expand_region(region):
+    """地域名を市区単位の地域名のリストに分ける。分けられない地域は [region] のまま返す
+
+    「東京」「大阪府」などの都道府県は市区（政令指定都市はさらに区）へ、
+    「横浜」「名古屋市」などの政令指定都市は区へ分ける。
+    """
+    data = load_regions()
+    prefectures, wards = data["prefectures"], data["wards"]
+    name = region.strip()
+    for pref, cities in prefectures.items():
+        if name in (pref, pref[:-1] if pref[-1] in "都府県" else pref):
+            subs = []
+            for city in cities:
+                if city in wards:
+                    subs += [f"{city}{w}" for w in wards[city]]
+                else:
+                    subs.append(f"{pref}{city}")  # 府中市・伊達市など同名の市があるため都道府県名を付ける
+            return subs
+    for city in (name, name + "市"):
+        if city in wards:
+            return [f"{city}{w}" for w in wards[city]]
+    return [name]
+
+
+def shard_queries(industry, region):
+    """分割後の検索クエリ一覧（元の地域のクエリを先頭に含める）"""
+    subs = expand_region(region)
+    if subs == [region.strip()]:
+        return [f"{industry} {region}"]
+    return [f"{industry} {region}"] + [f"{industry} {r}" for r in subs]
+
+
+def search_sharded(industry, region, count, serper_api_key="", workers=SHARD_WORKERS):
+    """地域を分割した複数のクエリで並行して検索し、ドメイン単位でまとめて最大 count 件返す
+
+    count 件集まった時点で、まだ始まっていない検索は取り消す。
+    """
+    queries = shard_queries(industry, region)
+    if len(queries) == 1:
+        return search_urls(queries[0], count, serper_api_key)
+    floor = 100 if serper_api_key else SHARD_MIN_COUNT  # Serper API は1回で100件取れるので1ページ分は使い切る
+    per_query = max(floor, -(-count * 2 // len(queries)))
+    print(f"  [*] {industry} {region}: {len(queries) - 1} 地域に分割して検索")
+    urls = []
+    seen = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(search_urls, q, per_query, serper_api_key): q for q in queries}
+        for fut in as_completed(futures):
+            try:
+                found = fut.result()
+            except Exception as e:
+                print(f"  [!] {futures[fut]}: 検索エラー {e}")
+                continue
+            for u in found:
+                domain = urlparse(u).netloc.lower()
+                if domain not in seen and not skip_url(u):
+                    seen.add(domain)
+                    urls.append(u)
+            if len(urls) >= count:
+                for f in futures:
+                    f.cancel()
+                break
+    print(f"  [*] {industry} {region}: {len(urls)} URLs（分割後）")
+    return urls[:count]
+
+
+def iter_sharded_urls(industry, region, serper_api_key=""):
+    """iter_search_urls の地域分割版。分割した地域を順に読み進め、ドメインの重複を除いて返す"""
+    seen = set()
+    for q in shard_queries(industry, region):
+        for u in iter_search_urls(q, serper_api_key):
+            domain = urlparse(u).netloc.lower()
+            if domain not in seen and not skip_url(u):
+                seen.add(domain)
+                yield u
+
+
+# ===== URLリストファイルの読み込み =====
+_url_file_counts = {}   # 絶対パス -> ((更新時刻, サイズ), 有効件数)
+
+
+def iter_url_file(path):
+    """URLリストを1行ずつ読み、除外ドメインとドメインの重複を取り除いたURLを順に返す"""
+    seen = set()
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        for line in f:
+            u = line.strip()
+            if not u.startswith("http") or skip_url(u):
+                continue
+            domain = urlparse(u).netloc.lower()
+            if not domain or domain in seen:
+                continue
+            seen.add(domain)
+            yield u
+
+
+def iter_url_chunks(path, size=URL_CHUNK):
+    """iter_url_file の結果を size 件ずつのリストにまとめて返す（全件をメモリに載せない）"""
+    return chunked(iter_url_file(path), size)
+
+
+def url_file_count(path):
+    """URLリストの有効件数。ファイルの更新時刻とサイズが前回と同じなら読み直さない"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0
+    key = os.path.abspath(path)
+    version = (st.st_mtime_ns, st.st_size)
+    cached = _url_file_counts.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    count = sum(1 for _ in iter_url_file(path))
+    _url_file_counts[key] = (version, count)
+    return count
+
+
 def manual_url_input():
     """手動URL入力およびファイル読み込み"""
     print("")
@@ -292,11 +601,7 @@ def manual_url_input():
     
     if os.path.exists(urls_file):
         print(f"  [*] '{urls_file}' を発見しました。読み込み中...")
-        with open(urls_file, "r", encoding="utf-8-sig") as f:
-            for line in f:
-                u = line.strip()
-                if u.startswith("http"):
-                    urls.append(u)
+        urls = list(iter_url_file(urls_file))
         if urls:
             print(f"  [+] {len(urls)} 件のURLをファイルから読み込みました。")
             return urls
@@ -318,6 +623,86 @@ def manual_url_input():
     return urls
 
 
+# ===== 事前DNS解決（死んだドメインの除外） =====
+def system_resolver(host):
+    """OSのリゾルバでホスト名を解決し、IPアドレスのリストを返す（解決できなければ例外）
+
+    順序は getaddrinfo の優先順のまま（重複だけ除く）。
+    """
+    return list(dict.fromkeys(info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)))
+
+
+def tcp_connector(address, port, timeout=CONNECT_TIMEOUT):
+    """address:port にTCP接続できるか"""
+    try:
+        with socket.create_connection((address, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class DnsCache:
+    """ジョブ中のDNS解決結果を保持するキャッシュ（スレッドセーフ）
+
+    resolver / connector を差し替えればネットワークなしで動作を確認できる。
+    """
+
+    def __init__(self, resolver=None, connector=None):
+        self.resolver = resolver or system_resolver
+        self.connector = connector
+        self._answers = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host):
+        """解決済みアドレスのリストを返す。NXDOMAIN等は空リスト"""
+        with self._lock:
+            if host in self._answers:
+                return self._answers[host]
+        try:
+            addrs = list(self.resolver(host))
+        except (OSError, UnicodeError):
+            addrs = []
+        with self._lock:
+            self._answers[host] = addrs
+        return addrs
+
+    def reachable(self, url):
+        """URLのホストが解決でき、（connector 指定時は）接続もできるか"""
+        parsed = urlparse(url)
+        host = parsed.hostname
+        if not host:
+            return False
+        addrs = self.resolve(host)
+        if not addrs:
+            return False
+        if self.connector is None:
+            return True
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        # 先頭の2つに加えて IPv4 / IPv6 それぞれ最低1つは試す（IPv6 に出られない環境で生きたサイトを落とさない）
+        first_by_family = {}
+        for a in addrs:
+            first_by_family.setdefault(":" in a, a)
+        tries = dict.fromkeys(addrs[:2] + list(first_by_family.values()))
+        return any(self.connector(a, port) for a in tries)
+
+
+def prefilter_urls(urls, dns=None, workers=DNS_WORKERS):
+    """全URLのホストを並行してDNS解決し、到達できないものを除外する
+
+    (生きているURL, 除外したURL) を元の順序のまま返す。
+    """
+    dns = dns or DnsCache(connector=tcp_connector)
+    if not urls:
+        return [], []
+    with ThreadPoolExecutor(max_workers=min(workers, len(urls))) as pool:
+        flags = list(pool.map(dns.reachable, urls))
+    viable = [u for u, ok in zip(urls, flags) if ok]
+    dropped = [u for u, ok in zip(urls, flags) if not ok]
+    if dropped:
+        print(f"  [*] DNS pre-check: {len(dropped)} dead domains skipped")
+    return viable, dropped
+
+
 def ok_email(email):
     e = email.lower()
     if len(e) < 5 or len(e) > 100:
@@ -339,7 +724,7 @@ def ok_email(email):
 def clean_phone(s):
     digits = re.sub(r'[^\d]', '', s)
     # ダミー番号を除外
-    if digits in ["0000000000", "0123456789", "00000000000"]:
+    if digits in DUMMY_PHONES:
         return ""
         
     if 10 <= len(digits) <= 11 and digits.startswith("0"):
@@ -376,10 +761,32 @@ def get_title(soup):
     return ""
 
 
-def extract_with_llm(text, url, openai_api_key):
-    """LLMを使ってテキストから代表連絡先を抽出する"""
+def get_llm_cache():
+    """プロセス内で共有するLLM抽出結果のキャッシュ（LLM_CACHE_PATH が空なら使わない）"""
+    global _llm_cache
+    with _session_lock:
+        if _llm_cache is None and LLM_CACHE_PATH:
+            import llm_cache
+            _llm_cache = llm_cache.LLMCache(LLM_CACHE_PATH)
+    return _llm_cache
+
+
+def extract_with_llm(text, url, openai_api_key, timeout=30):
+    """LLMを使ってテキストから代表連絡先を抽出する
+
+    同じテキスト（・モデル・プロンプトの版）の結果は get_llm_cache() から返し、APIを呼ばない。
+    """
     if not openai_api_key or not text.strip():
         return None
+
+    cache = get_llm_cache()
+    key = None
+    if cache is not None:
+        import llm_cache
+        key = llm_cache.cache_key(LLM_MODEL, LLM_PROMPT_VERSION, text[:10000])
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
         
     prompt = f"""
 以下の企業ウェブサイトのテキストから、代表となる問い合わせ用のメールアドレスと電話番号を1つずつ正確に抽出してください。
@@ -402,18 +809,21 @@ URL: {url}
         "Authorization": f"Bearer {openai_api_key}"
     }
     payload = {
-        "model": "gpt-4o-mini",
+        "model": LLM_MODEL,
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.0,
         "response_format": {"type": "json_object"}
     }
     
     try:
-        resp = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload, timeout=30)
+        resp = get_session().post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload, timeout=timeout)
         if resp.status_code == 200:
             data = resp.json()
             content = data["choices"][0]["message"]["content"]
-            return json.loads(content)
+            result = json.loads(content)
+            if cache is not None:
+                cache.put(key, result, tokens=data.get("usage", {}).get("total_tokens", 0))
+            return result
         else:
             print(f"  [!] OpenAI API Error: {resp.status_code} - {resp.text}")
     except Exception as e:
@@ -422,27 +832,557 @@ URL: {url}
     return None
 
 
-def scrape_site(url, openai_api_key=""):
-    """サイトからメアド・電話番号・法人名を抽出"""
-    emails = set()
-    phones = set()
+# ===== ホスト単位のサーキットブレーカー =====
+HARD_FAILURES = {"connect_timeout", "read_timeout", "tls", "refused", "connection", "server_error"}
+
+
+def classify_failure(exc=None, status=None):
+    """失敗の種類を返す（404などサイトが生きている場合は None）"""
+    if status is not None:
+        return "server_error" if status >= 500 else None
+    from requests import exceptions as rex
+    if isinstance(exc, rex.ConnectTimeout):
+        return "connect_timeout"
+    if isinstance(exc, rex.ReadTimeout):
+        return "read_timeout"
+    if isinstance(exc, rex.SSLError):
+        return "tls"
+    if isinstance(exc, rex.ConnectionError):
+        cause = exc
+        while cause is not None:
+            if isinstance(cause, ConnectionRefusedError) or "refused" in str(cause).lower():
+                return "refused"
+            cause = cause.args[0] if cause.args and isinstance(cause.args[0], BaseException) else cause.__cause__
+        return "connection"
+    return None
+
+
+class HostCircuitBreaker:
+    """ホストごとの連続失敗を数え、閾値を超えたホストへのアクセスを遮断する
+
+    ジョブ中は1つのインスタンスを全ワーカーで共有する（スレッドセーフ）。
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD):
+        self.threshold = threshold
+        self._failures = {}   # host -> [kind, ...]（連続失敗）
+        self._open = {}       # host -> 遮断理由
+        self._lock = threading.Lock()
+
+    def allow(self, host):
+        with self._lock:
+            return host not in self._open
+
+    def record_failure(self, host, kind):
+        """失敗を記録する。この呼び出しで遮断した場合 True"""
+        if kind not in HARD_FAILURES:
+            return False
+        with self._lock:
+            if host in self._open:
+                return False
+            kinds = self._failures.setdefault(host, [])
+            kinds.append(kind)
+            if len(kinds) >= self.threshold:
+                self._open[host] = kind
+                return True
+        return False
+
+    def record_success(self, host):
+        with self._lock:
+            self._failures.pop(host, None)
+
+    def open_hosts(self):
+        """遮断中のホストと理由"""
+        with self._lock:
+            return dict(self._open)
+
+
+# ===== 時間予算（デッドライン） =====
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """合計時間の上限。親（ジョブ全体など）の残り時間も考慮する"""
+
+    def __init__(self, seconds=None, parent=None):
+        self.expires = None if seconds is None else time.monotonic() + seconds
+        self.parent = parent
+
+    def remaining(self):
+        own = float("inf") if self.expires is None else self.expires - time.monotonic()
+        if self.parent is not None:
+            own = min(own, self.parent.remaining())
+        return max(own, 0.0)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def child(self, seconds):
+        return Deadline(seconds, parent=self)
+
+
+def fetch_page(url, breaker=None, deadline=None, headers=None, archive=None, **kwargs):
+    """1ページ取得する。失敗時は None を返し、ブレーカーに記録する
+
+    本文の読み込みも含めて REQUEST_BUDGET（と deadline の残り）以内に収まらなければ打ち切る。
+    archive（page_archive.PageArchive）を渡すと、取得できた応答をそのまま保存する。
+    """
+    host = urlparse(url).netloc.lower()
+    if breaker is not None and not breaker.allow(host):
+        return None
+    budget = REQUEST_BUDGET if deadline is None else min(REQUEST_BUDGET, deadline.remaining())
+    if budget <= 0:
+        return None
+    start = time.monotonic()
+    try:
+        r = get_session().get(url, headers=dict(HEADERS, **(headers or {})), timeout=min(TIMEOUT, budget),
+                              allow_redirects=True, stream=True, **kwargs)
+        # read1 は届いた分だけ返すので、少しずつ送ってくるサーバーでも予算で打ち切れる
+        read1 = getattr(r.raw, "read1", None)
+        chunks = []
+        while True:
+            if read1 is not None:
+                chunk = read1(16384, decode_content=True)
+            else:
+                chunk = r.raw.read(1024, decode_content=True)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if time.monotonic() - start > budget:
+                r.close()
+                raise DeadlineExceeded(url)
+        r._content = b"".join(chunks)
+        if archive is not None:
+            archive.record(url, r)
+    except DeadlineExceeded:
+        # 少しずつしか返さないサーバー。自分の予算で切れた場合だけホストの失敗として数える
+        if breaker is not None and budget >= REQUEST_BUDGET:
+            breaker.record_failure(host, "read_timeout")
+        return None
+    except Exception as e:
+        if breaker is not None:
+            breaker.record_failure(host, classify_failure(e))
+        return None
+    if breaker is not None:
+        kind = classify_failure(status=r.status_code)
+        if kind:
+            breaker.record_failure(host, kind)
+        else:
+            breaker.record_success(host)
+    return r
+
+
+# ===== パス別の取得実績（プローブ順序の最適化） =====
+SECOND_LEVEL = {"co", "or", "ne", "ac", "go", "lg", "ed", "gr", "ad"}
+
+
+def site_tld(host):
+    """co.jp / jp / com などの区分を返す"""
+    labels = host.split(":")[0].split(".")
+    if labels[-1].isdigit():
+        return "ip"
+    if len(labels) >= 3 and labels[-2] in SECOND_LEVEL:
+        return ".".join(labels[-2:])
+    return labels[-1]
+
+
+class PathYieldStats:
+    """業種 x TLD ごとに、どのパスでメール・電話番号が見つかったかを記録する永続ストア
+
+    実績が十分にあるパスは見つかりやすい順に試し、足りない連絡先が残りのパスで
+    見つかる見込みが YIELD_THRESHOLD を下回ったら、そのサイトの調査を打ち切る。
+    """
+
+    def __init__(self, path=None, min_samples=YIELD_MIN_SAMPLES, threshold=YIELD_THRESHOLD):
+        self.path = STATS_PATH if path is None else path
+        self.min_samples = min_samples
+        self.threshold = threshold
+        self._data = {}
+        self._lock = threading.Lock()
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+
+    @staticmethod
+    def _keys(industry, tld):
+        # 具体的なものから順に（実績が少なければ上位の集計を使う）
+        return [f"{industry}|{tld}", f"{industry}|*", f"*|{tld}", "*|*"]
+
+    def rates(self, industry, tld, path):
+        """(メールが見つかる率, 電話番号が見つかる率)。実績不足なら None"""
+        with self._lock:
+            for key in self._keys(industry, tld):
+                c = self._data.get(key, {}).get(path)
+                if c and c["probes"] >= self.min_samples:
+                    return c["email"] / c["probes"], c["phone"] / c["probes"]
+        return None
+
+    def order(self, paths, industry, tld):
+        """トップページは先頭のまま、残りを見つかりやすい順に並べる（実績のないパスは優先して試す）"""
+        def score(path):
+            r = self.rates(industry, tld, path)
+            return 2.0 if r is None else r[0] + r[1]
+        head = [p for p in paths if p == ""]
+        rest = sorted((p for p in paths if p != ""), key=score, reverse=True)
+        return head + rest
+
+    def expected_yield(self, remaining, need_email, need_phone, industry, tld):
+        """残りのパスで足りない連絡先が1つでも見つかる見込み（実績のないパスがあれば 1.0）"""
+        if not need_email and not need_phone:
+            return 0.0
+        miss = 1.0
+        for path in remaining:
+            r = self.rates(industry, tld, path)
+            if r is None:
+                return 1.0
+            p = max(r[0] if need_email else 0.0, r[1] if need_phone else 0.0)
+            miss *= 1.0 - p
+        return 1.0 - miss
+
+    def record(self, industry, tld, path, found_email, found_phone):
+        with self._lock:
+            for key in self._keys(industry, tld):
+                c = self._data.setdefault(key, {}).setdefault(path, {"probes": 0, "email": 0, "phone": 0})
+                c["probes"] += 1
+                c["email"] += bool(found_email)
+                c["phone"] += bool(found_phone)
+
+    def save(self):
+        if not self.path:
+            return
+        # 同じインスタンスを複数のジョブで共有するので、一時ファイルの書き込みもロック内で行う
+        with self._lock:
+            tmp = self.path + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self._data, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError:
+                pass
+
+
+def average_probes_saved(results):
+    """実績による打ち切りで省けたリクエスト数の平均（1サイトあたり）"""
+    saved = [r.get("probes_saved", 0) for r in results]
+    return sum(saved) / len(saved) if saved else 0.0
+
+
+def extract_contacts(html, soup):
+    """1ページ分のHTMLからメール・電話番号を抽出する
+
+    {値: 見つかった場所} の dict を (emails, phones) で返す。
+    場所は "link"（mailto:/tel: リンク）か "text"（本文中）。
+    """
+    emails = {}
+    phones = {}
+
+    # 従来のテキストからの抽出 (フォールバック / ベースライン処理)
+    for m in EMAIL_RE.findall(html):
+        if ok_email(m):
+            emails.setdefault(m.lower(), "text")
+    
+    # mailto リンクからの抽出
+    for a in soup.select("a[href^='mailto:']"):
+        addr = a["href"].replace("mailto:", "").split("?")[0].strip()
+        if addr and ok_email(addr):
+            emails[addr.lower()] = "link"
+
+    # 電話番号の抽出
+    for m in PHONE_RE.findall(html):
+        p = clean_phone(m)
+        if p:
+            phones.setdefault(p, "text")
+    for a in soup.select("a[href^='tel:']"):
+        p = clean_phone(a["href"].replace("tel:", ""))
+        if p:
+            phones[p] = "link"
+
+    return emails, phones
+
+
+# ===== 構造化データ（JSON-LD / microdata） =====
+def _structured_phone(value):
+    """+81 表記も国内表記に直して clean_phone にかける"""
+    value = re.sub(r"^\s*\+81[\s\-]*(\(0\))?0?", "0", str(value))
+    return clean_phone(value)
+
+
+def _structured_email(value):
+    e = str(value).replace("mailto:", "").split("?")[0].strip().lower()
+    return e if ok_email(e) else ""
+
+
+# 連絡先を読む schema.org の型（Organization / LocalBusiness と、よく使われる下位型）
+STRUCTURED_ORG_TYPES = frozenset({
+    "Organization", "Corporation", "LocalBusiness", "ProfessionalService", "Store", "OnlineStore",
+    "MedicalOrganization", "EducationalOrganization", "School", "NGO", "SportsOrganization",
+    "FoodEstablishment", "Restaurant", "CafeOrCoffeeShop", "Bakery", "BarOrPub", "FastFoodRestaurant",
+    "HealthAndBeautyBusiness", "BeautySalon", "HairSalon", "NailSalon", "DaySpa", "HealthClub",
+    "MedicalBusiness", "MedicalClinic", "Dentist", "Physician", "Pharmacy", "Optician",
+    "LegalService", "Attorney", "Notary", "FinancialService", "AccountingService", "InsuranceAgency",
+    "RealEstateAgent", "HomeAndConstructionBusiness", "GeneralContractor", "Electrician", "Plumber",
+    "HousePainter", "RoofingContractor", "Locksmith", "MovingCompany", "AutomotiveBusiness",
+    "AutoRepair", "AutoDealer", "LodgingBusiness", "Hotel", "TravelAgency", "EmploymentAgency",
+    "ChildCare", "DryCleaningOrLaundry", "EntertainmentBusiness", "SportsActivityLocation",
+    "ClothingStore", "ShoppingCenter", "SelfStorage",
+})
+# この役割で入れ子になった組織・人物は、サイト運営者ではない（制作会社・著者など）
+STRUCTURED_SKIP_ROLES = frozenset({"creator", "publisher", "author"})
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _is_org_type(value):
+    """@type / itemtype（文字列・リスト・URL）が STRUCTURED_ORG_TYPES のいずれかを含むか"""
+    values = value if isinstance(value, list) else str(value or "").split()
+    return any(str(v).rstrip("/").rsplit("/", 1)[-1] in STRUCTURED_ORG_TYPES for v in values)
+
+
+def _jsonld_orgs(data):
+    """JSON-LD の最上位（リスト・@graph を含む）にある組織ノードだけを返す
+
+    creator / publisher / author などの入れ子の組織や Person は対象にしない。
+    """
+    if isinstance(data, list):
+        for item in data:
+            yield from _jsonld_orgs(item)
+    elif isinstance(data, dict):
+        if "@graph" in data:
+            yield from _jsonld_orgs(data["@graph"])
+        if _is_org_type(data.get("@type")):
+            yield data
+
+
+def _microdata_props(scope):
+    """microdata の itemscope 直下の itemprop を {名前: 値} にまとめる"""
+    props = {}
+    for el in scope.find_all(attrs={"itemprop": True}):
+        # 入れ子の itemscope に属する項目（住所など）は、その要素自身の分として扱う
+        if el.find_parent(attrs={"itemscope": True}) is not scope:
+            continue
+        value = el.get("content") or el.get("href") or el.get_text(strip=True)
+        for prop in el["itemprop"].split():
+            props.setdefault(prop, value)
+    return props
+
+
+def _microdata_skipped(scope):
+    """scope 自身か、それを含む itemscope が creator / publisher / author として入れ子になっているか"""
+    el = scope
+    while el is not None:
+        if set(str(el.get("itemprop") or "").split()) & STRUCTURED_SKIP_ROLES:
+            return True
+        el = el.find_parent(attrs={"itemscope": True})
+    return False
+
+
+def extract_structured(soup):
+    """schema.org の JSON-LD / microdata から法人名・メール・電話番号を取り出す
+
+    {"name": ..., "emails": [...], "phones": [...]} を返す。
+    サイト運営者の組織（Organization / LocalBusiness とその下位型）と、その contactPoint だけを読む。
+    JSON-LD は最上位と @graph のノード、microdata は creator / publisher / author 以外の項目が対象。
+    """
     name = ""
-    accumulated_text = ""
+    emails = []
+    phones = []
+
+    def add(node_name, email, phone):
+        nonlocal name
+        e = _structured_email(email) if email else ""
+        p = _structured_phone(phone) if phone else ""
+        if not (e or p):
+            return
+        if node_name and not name:
+            name = str(node_name).strip()
+        if e and e not in emails:
+            emails.append(e)
+        if p and p not in phones:
+            phones.append(p)
+
+    for tag in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(tag.string or tag.get_text() or "")
+        except ValueError:
+            continue
+        for node in _jsonld_orgs(data):
+            points = [node] + [p for p in _as_list(node.get("contactPoint")) if isinstance(p, dict)]
+            for point in points:
+                for email in _as_list(point.get("email")):
+                    add(node.get("name"), email, None)
+                for phone in _as_list(point.get("telephone")):
+                    add(node.get("name"), None, phone)
+
+    for scope in soup.select("[itemscope][itemtype*='schema.org']"):
+        if not _is_org_type(scope.get("itemtype")) or _microdata_skipped(scope):
+            continue
+        props = _microdata_props(scope)
+        points = [props] + [_microdata_props(cp) for cp in scope.find_all(attrs={"itemscope": True})
+                            if "contactPoint" in str(cp.get("itemprop") or "").split()
+                            and cp.find_parent(attrs={"itemscope": True}) is scope]
+        for point in points:
+            add(props.get("name"), point.get("email"), None)
+            add(props.get("name"), None, point.get("telephone"))
+
+    return {"name": name, "emails": emails, "phones": phones}
+
+
+def structured_confident(data):
+    """構造化データだけで法人名・メール・電話番号がそろっているか（残りの調査を省略してよいか）"""
+    return bool(data["name"] and data["emails"] and data["phones"])
 
-    base = f"{urlparse(url).scheme}://{urlparse(url).netloc}"
-    paths = ["", "/contact", "/about", "/company", "/access"]
 
-    for path in paths:
+# ===== 抽出結果の確信度（LLMを呼ぶかどうかの判定） =====
+LOCATION_RANK = {"text": 0, "link": 1, "structured": 2}
+
+
+def merge_found(found, page):
+    """{値: 見つかった場所} を合算する。同じ値は、より確かな場所（構造化データ > リンク > 本文）を残す"""
+    for value, where in page.items():
+        if LOCATION_RANK.get(where, 0) >= LOCATION_RANK.get(found.get(value), -1):
+            found[value] = where
+
+
+def _domain_matches(email, host):
+    """メールのドメインがサイトのドメインと一致するか（www. やサブドメインの違いは無視）"""
+    domain = email.rsplit("@", 1)[-1]
+    host = host.split(":")[0]
+    host = host[4:] if host.startswith("www.") else host
+    return domain == host or host.endswith("." + domain) or domain.endswith("." + host)
+
+
+def contact_confidence(emails, phones, host):
+    """正規表現・mailto/tel・構造化データで見つかった連絡先がどれだけ確かかを 0〜1 で返す
+
+    候補が1つだけ・リンクや構造化データで示されている・メールのドメインがサイトと同じ、
+    ほど高い。候補が複数なら割り引き、メール・電話番号のどちらかが無ければ 0。
+    """
+    def score(candidates, base, bonus):
+        if not candidates:
+            return 0.0
+        best = max(bonus(value, where) + base for value, where in candidates.items())
+        return min(best, 1.0) / (1 + 0.5 * (len(candidates) - 1))
+
+    email_score = score(emails, 0.5, lambda e, where: 0.25 * (where != "text") + 0.25 * _domain_matches(e, host))
+    phone_score = score(phones, 0.7, lambda p, where: 0.3 * (where != "text"))
+    return min(email_score, phone_score)
+
+
+def apply_llm_result(emails, phones, llm_result):
+    """LLMの抽出結果を {値: 場所} の dict に加える"""
+    if not llm_result:
+        return
+    if llm_result.get("email") and ok_email(llm_result["email"]):
+        emails.setdefault(llm_result["email"].lower(), "llm")
+    if llm_result.get("phone"):
+        p = clean_phone(llm_result["phone"])
+        if p:
+            phones.setdefault(p, "llm")
+
+
+def extract_page(r, homepage=False):
+    """1ページ分の応答から連絡先を抽出する（scrape_site と refresh_site で共有）
+
+    (soup, emails, phones, structured) を返す。emails / phones は {値: 見つかった場所}。
+    トップページでは構造化データも読み、それだけで法人名・連絡先がそろう場合は
+    構造化データの連絡先だけを返す（フッターの制作会社のメールなどは拾わない）。
+    """
+    # 文字化け対策: apparent_encoding を使用
+    r.encoding = r.apparent_encoding
+    soup = make_soup(r.text)
+    emails, phones = extract_contacts(r.text, soup)
+    structured = extract_structured(soup) if homepage else None
+    if structured and structured_confident(structured):
+        emails = dict.fromkeys(structured["emails"], "structured")
+        phones = dict.fromkeys(structured["phones"], "structured")
+    elif structured:
+        for e in structured["emails"]:
+            emails[e] = "structured"
+        for p in structured["phones"]:
+            phones[p] = "structured"
+    return soup, emails, phones, structured
+
+
+def kept_sources(sources, emails, phones):
+    """sources の各ページの連絡先を、結果に残した emails / phones だけに絞る"""
+    return {page_url: dict(src, emails=[e for e in src["emails"] if e in emails],
+                           phones=[p for p in src["phones"] if p in phones])
+            for page_url, src in sources.items()}
+
+
+def page_validators(r):
+    """再検証用に ETag / Last-Modified と本文のハッシュを取り出す"""
+    return {
+        "etag": r.headers.get("ETag", ""),
+        "last_modified": r.headers.get("Last-Modified", ""),
+        "hash": hashlib.sha1(r.content).hexdigest(),
+    }
+
+
+def scrape_site(url, openai_api_key="", breaker=None, deadline=None, stats=None, industry="",
+                llm_threshold=None, fetch=None):
+    """サイトからメアド・電話番号・法人名を抽出
+
+    breaker: ジョブ全体で共有する HostCircuitBreaker（省略時はこのサイト限り）
+    deadline: ジョブ全体の Deadline。サイトごとの予算 SITE_BUDGET はこの内側で計る
+    stats: PathYieldStats。指定するとパスの順序と打ち切りを実績で決め、結果も記録する
+    llm_threshold: contact_confidence がこれ未満のときだけLLMを呼ぶ（省略時 LLM_CONFIDENCE_THRESHOLD）
+    fetch: fetch_page の代わりに使う取得関数 (url, breaker, deadline) -> 応答 or None。
+           アーカイブからの再抽出などオフラインで使う場合は、ページ間の待ち時間も入れない
+
+    結果の "sources" には、連絡先が見つかったページごとに URL・ETag・Last-Modified と
+    そのページで見つかった連絡先を記録する（refresh_results で再検証に使う）。
+    """
+    emails = {}   # 値 -> 見つかった場所（contact_confidence で使う）
+    phones = {}
+    name = ""
+    accumulated_text = ""
+    cut_short = False
+    sources = {}
+    breaker = breaker or HostCircuitBreaker()
+    site_deadline = (deadline or Deadline()).child(SITE_BUDGET)
+    polite = fetch is None
+    fetch = fetch or fetch_page
+
+    host = urlparse(url).netloc.lower()
+    base = f"{urlparse(url).scheme}://{urlparse(url).netloc}"
+    tld = site_tld(host)
+    paths = stats.order(PROBE_PATHS, industry, tld) if stats else list(PROBE_PATHS)
+    probes_saved = 0
+    structured_saved = 0
+
+    for n, path in enumerate(paths):
+        if stats and n > 0 and stats.expected_yield(
+                paths[n:], not emails, not phones, industry, tld) < stats.threshold:
+            probes_saved = len(paths) - n  # 残りのパスでは見つかる見込みが低い
+            break
+        if not breaker.allow(host):
+            break  # 落ちているサイトには残りのパスを試さない
+        if site_deadline.expired():
+            cut_short = True
+            break
+        if site_deadline.remaining() < DEADLINE_MARGIN and path not in HIGH_VALUE_PATHS:
+            cut_short = True  # 時間切れ間近は優先度の低いページを飛ばす
+            continue
         try:
-            time.sleep(0.5)
-            r = requests.get(base + path, headers=HEADERS, timeout=TIMEOUT, allow_redirects=True)
+            if polite:
+                time.sleep(0.5)
+            page_url = base + path
+            r = fetch(page_url, breaker, site_deadline)
+            if r is None:
+                continue
             if r.status_code != 200:
+                if stats and r.status_code < 500:
+                    stats.record(industry, tld, path, False, False)
                 continue
 
-            # 文字化け対策: apparent_encoding を使用
-            r.encoding = r.apparent_encoding
-            
-            soup = BeautifulSoup(r.text, "lxml")
+            soup, page_emails, page_phones, structured = extract_page(r, homepage=path == "")
             if not name:
                 name = get_title(soup)
                 
@@ -450,50 +1390,497 @@ def scrape_site(url, openai_api_key=""):
             if openai_api_key and len(accumulated_text) < 10000:
                 accumulated_text += soup.get_text(separator="\n", strip=True) + "\n\n"
 
-            # 従来のテキストからの抽出 (フォールバック / ベースライン処理)
-            for m in EMAIL_RE.findall(r.text):
-                if ok_email(m):
-                    emails.add(m.lower())
-            
-            # mailto リンクからの抽出
-            for a in soup.select("a[href^='mailto:']"):
-                addr = a["href"].replace("mailto:", "").split("?")[0].strip()
-                if addr and ok_email(addr):
-                    emails.add(addr.lower())
-
-            # 電話番号の抽出
-            for m in PHONE_RE.findall(r.text):
-                p = clean_phone(m)
-                if p:
-                    phones.add(p)
-            for a in soup.select("a[href^='tel:']"):
-                p = clean_phone(a["href"].replace("tel:", ""))
-                if p:
-                    phones.add(p)
+            if page_emails or page_phones:
+                sources[page_url] = dict(page_validators(r), emails=list(page_emails), phones=list(page_phones))
+            merge_found(emails, page_emails)
+            merge_found(phones, page_phones)
+            if stats:
+                stats.record(industry, tld, path, page_emails, page_phones)
+
+            # トップページの構造化データで法人名・連絡先がそろえば、残りのパスとLLMは不要
+            if structured and structured_confident(structured):
+                name = structured["name"]
+                emails = dict(page_emails)
+                phones = dict(page_phones)
+                structured_saved = len(paths) - n - 1
+                probes_saved += structured_saved
+                break
 
         except Exception:
             continue
             
-    # LLMによる高精度抽出（オプション）
-    if openai_api_key and accumulated_text:
-        llm_result = extract_with_llm(accumulated_text, url, openai_api_key)
-        if llm_result:
-            if llm_result.get("email") and ok_email(llm_result["email"]):
-                emails.add(llm_result["email"].lower())
-            if llm_result.get("phone"):
-                p = clean_phone(llm_result["phone"])
-                if p:
-                    phones.add(p)
-
+    # LLMによる高精度抽出（オプション）。決定的な抽出で確かな結果が出ていれば呼ばない
+    confidence = contact_confidence(emails, phones, host)
+    if llm_threshold is None:
+        llm_threshold = LLM_CONFIDENCE_THRESHOLD
+    llm_saved = bool(openai_api_key and structured_saved)
+    llm_called = bool(openai_api_key and accumulated_text and not site_deadline.expired()
+                      and not llm_saved and confidence < llm_threshold)
+    if llm_called:
+        apply_llm_result(emails, phones, extract_with_llm(accumulated_text, url, openai_api_key,
+                                                          timeout=min(30, site_deadline.remaining())))
+
+    kept_emails = sorted(emails)[:3]
+    kept_phones = sorted(phones)[:2]
     return {
         "name": name or urlparse(url).netloc,
         "url": url,
-        "emails": sorted(emails)[:3],
-        "phones": sorted(phones)[:2],
+        "emails": kept_emails,
+        "phones": kept_phones,
+        "cut_short": cut_short,
+        "sources": kept_sources(sources, kept_emails, kept_phones),
+        "probes_saved": probes_saved,
+        "structured": structured_saved,
+        "llm_saved": llm_saved,
+        "llm_called": llm_called,
+        "confidence": round(confidence, 2),
     }
 
 
-def save_csv(results, industry, region):
+# ===== 再検証（refresh）モード =====
+def refresh_site(info, breaker=None, deadline=None):
+    """前回の結果の連絡先掲載ページだけを条件付きGETで確認し、変わったページだけ再抽出する
+
+    変更がなければ (元の結果, "unchanged")、変わっていれば (新しい結果, "changed") を返す。
+    ページが無くなった（404 / 410）ときだけ、そのページ由来の連絡先を外す。
+    それ以外で確認できなかったページ（取得失敗・リダイレクトのループ・429 などの 4xx・5xx）は
+    前回の内容のまま残し、他に変更がなければ (元の結果, "unverified") を返す。
+    ページ情報のない連絡先（LLM抽出分など）は引き継ぐ。
+    """
+    sources = info.get("sources") or {}
+    if not sources:
+        return info, "unchanged"
+
+    breaker = breaker or HostCircuitBreaker()
+    site_deadline = (deadline or Deadline()).child(SITE_BUDGET)
+    new_sources = {}
+    changed = False
+    unverified = False
+    for page_url, src in sources.items():
+        headers = {}
+        if src.get("etag"):
+            headers["If-None-Match"] = src["etag"]
+        if src.get("last_modified"):
+            headers["If-Modified-Since"] = src["last_modified"]
+        r = fetch_page(page_url, breaker, site_deadline, headers=headers)
+        if r is not None and r.status_code == 304:
+            new_sources[page_url] = src  # 未変更
+            continue
+        if r is not None and r.status_code in PAGE_GONE_STATUSES:
+            changed = True  # ページが無くなった -> そのページ由来の連絡先は外す
+            continue
+        if r is None or r.status_code != 200:
+            new_sources[page_url] = src  # 確認できず（アクセス制限・一時的なエラーなど）
+            unverified = True
+            continue
+        if src.get("hash") == hashlib.sha1(r.content).hexdigest():
+            new_sources[page_url] = src  # ETag 等のないサーバーでも本文が同じなら未変更
+            continue
+        changed = True
+        _, page_emails, page_phones, _ = extract_page(r, homepage=urlparse(page_url).path in ("", "/"))
+        if page_emails or page_phones:
+            new_sources[page_url] = dict(page_validators(r), emails=list(page_emails), phones=list(page_phones))
+
+    if not changed:
+        return info, "unverified" if unverified else "unchanged"
+
+    # 旧ソース由来でない連絡先（LLM抽出分など）はそのまま引き継ぐ
+    old_from_pages_e = {e for src in sources.values() for e in src.get("emails", [])}
+    old_from_pages_p = {p for src in sources.values() for p in src.get("phones", [])}
+    emails = {e for e in info["emails"] if e not in old_from_pages_e}
+    phones = {p for p in info["phones"] if p not in old_from_pages_p}
+    for src in new_sources.values():
+        emails.update(src["emails"])
+        phones.update(src["phones"])
+
+    emails = sorted(emails)[:3]
+    phones = sorted(phones)[:2]
+    return dict(info, emails=emails, phones=phones, sources=kept_sources(new_sources, emails, phones)), "changed"
+
+
+def refresh_results(rows, workers=8, job_budget=None):
+    """結果ファイルの全行を並行して再検証する
+
+    (新しい ResultStore, {"unchanged": n, "changed": n, "unverified": n}) を返す。
+    """
+    breaker = HostCircuitBreaker()
+    deadline = Deadline(job_budget)
+    store = ResultStore()
+    counts = {"unchanged": 0, "changed": 0, "unverified": 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for info, status in pool.map(lambda r: refresh_site(r, breaker, deadline), rows):
+            counts[status] += 1
+            store.append(dict(info, refreshed=status))
+    return store, counts
+
+
+def save_results_jsonl(rows, path):
+    """再検証用に、連絡先の掲載ページ情報も含めた結果を JSON Lines で保存する"""
+    with open(path, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    return path
+
+
+def load_results_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+# ===== 結果ストア（省メモリ） =====
+class ResultStore:
+    """ジョブの結果を列ごとの配列で保持するストア
+
+    1サイト1 dict の代わりに、ドメイン・クエリは番号で持って文字列を共有し、
+    メール・電話番号は1本の文字列に詰めて保持する。
+    max_in_memory 件を超えた分は一時ファイル（JSON Lines）に退避し、
+    プレビュー・CSV出力・GAS送信は iter_chunks() などで少しずつ読み出す。
+    """
+
+    SEP = "\t"
+    FLAG_CUT_SHORT = 1
+
+    def __init__(self, max_in_memory=STORE_MAX_IN_MEMORY, spill_dir=None, preview_rows=PREVIEW_ROWS):
+        self.max_in_memory = max_in_memory
+        self.spill_dir = spill_dir
+        self._labels = [""]      # ドメイン・クエリ名の共有テーブル（0 は空文字）
+        self._label_ids = {"": 0}
+        self._reset_columns()
+        self._recent = deque(maxlen=preview_rows)
+        self._spill = None
+        self._spilled = 0
+        self._with_info = 0
+        self._lock = threading.Lock()
+
+    def _reset_columns(self):
+        self._names = []
+        self._urls = []
+        self._domains = array("I")
+        self._queries = array("I")
+        self._emails = []
+        self._phones = []
+        self._flags = array("B")
+        self._extra = {}         # 行番号 -> その他の項目（ある行だけ）
+
+    def _label(self, text):
+        i = self._label_ids.get(text)
+        if i is None:
+            i = self._label_ids[text] = len(self._labels)
+            self._labels.append(sys.intern(text))
+        return i
+
+    def append(self, info):
+        extra = {k: v for k, v in info.items()
+                 if k not in ("name", "url", "emails", "phones", "query", "cut_short") and v}
+        with self._lock:
+            if extra:
+                self._extra[len(self._names)] = extra
+            self._names.append(info["name"])
+            self._urls.append(info["url"])
+            self._domains.append(self._label(urlparse(info["url"]).netloc.lower()))
+            self._queries.append(self._label(info.get("query") or ""))
+            self._emails.append(self.SEP.join(info["emails"]))
+            self._phones.append(self.SEP.join(info["phones"]))
+            self._flags.append(self.FLAG_CUT_SHORT if info.get("cut_short") else 0)
+            self._recent.append(info)
+            self._with_info += bool(info["emails"] or info["phones"])
+            if self.max_in_memory is not None and len(self._names) > self.max_in_memory:
+                self._flush()
+
+    def extend(self, infos):
+        for info in infos:
+            self.append(info)
+
+    def _row(self, i):
+        d = {
+            "name": self._names[i],
+            "url": self._urls[i],
+            "emails": self._emails[i].split(self.SEP) if self._emails[i] else [],
+            "phones": self._phones[i].split(self.SEP) if self._phones[i] else [],
+            "cut_short": bool(self._flags[i] & self.FLAG_CUT_SHORT),
+        }
+        if self._queries[i]:
+            d["query"] = self._labels[self._queries[i]]
+        if i in self._extra:
+            d.update(self._extra[i])
+        return d
+
+    def _flush(self):
+        if self._spill is None:
+            self._spill = tempfile.NamedTemporaryFile(
+                "w+", encoding="utf-8", suffix=".jsonl", prefix="results_", dir=self.spill_dir, delete=False)
+        for i in range(len(self._names)):
+            self._spill.write(json.dumps(self._row(i), ensure_ascii=False) + "\n")
+        self._spill.flush()
+        self._spilled += len(self._names)
+        self._reset_columns()
+
+    def __len__(self):
+        return self._spilled + len(self._names)
+
+    @property
+    def with_info(self):
+        return self._with_info
+
+    def __iter__(self):
+        """全件を dict で順に返す（退避分はファイルから1行ずつ読む）"""
+        with self._lock:
+            spilled = self._spilled
+            rows = [self._row(i) for i in range(len(self._names))]
+            path = self._spill.name if self._spill is not None else None
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                for i, line in enumerate(f):
+                    if i >= spilled:
+                        break
+                    yield json.loads(line)
+        yield from rows
+
+    def iter_chunks(self, size=GAS_CHUNK, only_with_info=False):
+        chunk = []
+        for r in self:
+            if only_with_info and not (r["emails"] or r["phones"]):
+                continue
+            chunk.append(r)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def tail(self, n=PREVIEW_ROWS):
+        """直近 n 件（プレビュー用。最大 preview_rows 件）"""
+        with self._lock:
+            rows = list(self._recent)
+        return rows[-n:]
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            try:
+                os.remove(self._spill.name)
+            except OSError:
+                pass
+            self._spill = None
+            self._spilled = 0
+
+    def __del__(self):
+        self.close()
+
+
+# ===== 結果の後処理（pandas でまとめて処理） =====
+RESULT_COLUMNS = ["法人名", "メールアドレス", "電話番号", "URL", "重複グループ", "重複候補", "共通連絡先"]
+
+
+def normalize_phones(s):
+    """clean_phone と同じ整形を Series 全体に対して行う（無効な番号は空文字）"""
+    import numpy as np
+    d = s.astype(str).str.replace(r"\D", "", regex=True)
+    n = d.str.len()
+    valid = n.between(10, 11) & d.str.startswith("0") & ~d.isin(DUMMY_PHONES)
+    free = d.str.match(r"0(?:120|800)")
+    two = d.str.match(r"0[36]")
+    out = np.select(
+        [~valid, n == 10, free, two],
+        [
+            "",
+            d.str[:2] + "-" + d.str[2:6] + "-" + d.str[6:],
+            d.str[:4] + "-" + d.str[4:7] + "-" + d.str[7:],
+            d.str[:2] + "-" + d.str[2:6] + "-" + d.str[6:],
+        ],
+        default=d.str[:3] + "-" + d.str[3:7] + "-" + d.str[7:],
+    )
+    return s.__class__(out, index=s.index)
+
+
+def _join_per_row(values, index):
+    """1行1値に展開した Series を元の行ごとに " / " で連結する（重複は除く）"""
+    if values.empty:
+        return values.__class__("", index=index)
+    f = values.rename("v").rename_axis("row").reset_index().drop_duplicates()
+    f["pos"] = f.groupby("row").cumcount()
+    wide = f.pivot(index="row", columns="pos", values="v")
+    joined = wide[0]
+    for col in wide.columns[1:]:
+        joined = joined.where(wide[col].isna(), joined + " / " + wide[col])
+    return joined.reindex(index).fillna("")
+
+
+def _connected_rows(rows, values):
+    """同じ値を持つ行どうしをつなぎ、行ごとに「その連結成分で最小の行」を返す（Series）
+
+    A と B が電話番号を、B と C がメールドメインを共有していれば、A・B・C は同じ成分になる。
+    「値ごとの最小ラベル -> 行ごとの最小ラベル」をラベルが変わらなくなるまで繰り返す
+    （行ごとの Python ループを使わない。繰り返し回数は連鎖の長さ程度で済む）。
+    """
+    import numpy as np
+    import pandas as pd
+
+    rows = np.asarray(rows)
+    codes, _ = pd.factorize(np.asarray(values))
+    label = pd.Series(rows, index=rows).groupby(level=0).min()
+    while True:
+        by_value = pd.Series(label.reindex(rows).to_numpy()).groupby(codes).transform("min")
+        new = pd.Series(by_value.to_numpy(), index=rows).groupby(level=0).min()
+        if new.equals(label):
+            return label
+        label = new
+
+
+def _result_frame(rows, start=0, with_query=None):
+    """結果の dict から必要な列だけを DataFrame にする（行番号は start から振る）
+
+    with_query が None なら、クエリが1件でもあるときだけ「クエリ」列を残す。
+    """
+    import pandas as pd
+
+    # dict のリストを丸ごと作らず、必要な列だけを順に読み出す（ResultStore からも使える）
+    cols = {"name": [], "url": [], "emails": [], "phones": [], "query": []}
+    for r in rows:
+        for key in cols:
+            cols[key].append(r.get(key, ""))
+    if with_query is None:
+        with_query = any(cols["query"])
+    if not with_query:
+        del cols["query"]
+    df = pd.DataFrame(cols)
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def _contacts(df):
+    """電話番号・メールを1行1連絡先に展開して正規化する（元の行番号を index に持つ）"""
+    import numpy as np
+
+    # スキームの後ろからホスト名だけを取り出す（str.extract より置換2回のほうが速い）
+    url = df["url"].where(df["url"].str.contains(r"^[a-zA-Z]+://", regex=True), "")
+    site = url.str.replace(r"^[a-zA-Z]+://", "", regex=True).str.replace(r"[/:?#].*$", "", regex=True)
+    site = site.str.lower().str.replace(r"^www\.", "", regex=True)
+
+    ph = df["phones"].explode().dropna().astype(str)
+    ph = normalize_phones(ph)
+    ph = ph[ph != ""].to_frame("phone")
+    ph["site"] = site.reindex(ph.index).values
+
+    em = df["emails"].explode().dropna().astype(str).str.strip().str.lower()
+    em = em[em.str.contains("@", regex=False)].to_frame("email")
+    em["site"] = site.reindex(em.index).values
+    em["domain"] = em["email"].str.replace(r"^.*@", "", regex=True)
+    # サイト自身のドメイン（またはその親ドメイン）のメールか。"." を前に付けて後方一致で判定する
+    em["own"] = np.char.endswith(("." + em["site"]).to_numpy(str), ("." + em["domain"]).to_numpy(str))
+    return ph, em
+
+
+def _duplicate_groups(ph, em, index):
+    """行ごとの重複グループ番号（なしは 0）と共通連絡先の印を返す
+
+    ph・em は全件分の _contacts() の結果（em は domain・site・own 列があればよい）。
+    """
+    import pandas as pd
+
+    # 複数サイトで共有されている連絡先
+    phone_shared = ph.groupby("phone")["site"].transform("nunique") > 1
+    domain_sites = em.groupby("domain")["site"].transform("nunique")
+    free = em["domain"].isin(FREE_MAIL_DOMAINS)
+    agency = (domain_sites >= AGENCY_MIN_SITES) & ~em["own"] & ~free
+
+    # 重複グループ: 共有されている電話番号・メールドメインでつながる行をまとめる
+    shared_domain = (domain_sites > 1) & ~free
+    shared = pd.concat([ph.loc[phone_shared, "phone"], "@" + em.loc[shared_domain, "domain"]])
+    group_key = _connected_rows(shared.index, shared.to_numpy()).astype("float64").reindex(index)
+    codes, _ = pd.factorize(group_key, use_na_sentinel=True)
+    group = pd.Series(codes + 1, index=index).where(codes >= 0, 0).astype(int)
+    agency = agency.groupby(level=0).any().reindex(index, fill_value=False).astype(bool)
+    return group, agency
+
+
+def _result_table(df, ph, em, group, agency):
+    """出力用の列（RESULT_COLUMNS、クエリがあれば先頭に「クエリ」）にまとめる"""
+    import pandas as pd
+
+    out = pd.DataFrame(index=df.index)
+    if "query" in df.columns:
+        out["クエリ"] = df["query"]
+    out["法人名"] = df["name"]
+    out["メールアドレス"] = _join_per_row(em["email"], df.index)
+    out["電話番号"] = _join_per_row(ph["phone"], df.index)
+    out["URL"] = df["url"]
+    out["重複グループ"] = group.reindex(df.index)
+    out["重複候補"] = out["重複グループ"] > 0
+    out["共通連絡先"] = agency.reindex(df.index)
+    return out
+
+
+def postprocess_results(results):
+    """スクレイピング結果を DataFrame にまとめ、連絡先の正規化と重複判定を行う
+
+    - 電話番号・メールをベクトル演算で正規化
+    - 同じ電話番号／メールドメインを持つ別サイトを「重複候補」として同じグループにまとめる
+      （gmail.com などのフリーメールのドメインは別会社でも共通なので使わない）
+    - 同じメールドメインが多数のサイトに出る場合は「共通連絡先」（制作会社等）として印を付ける
+    """
+    import pandas as pd
+
+    df = _result_frame(results)
+    if df.empty:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    ph, em = _contacts(df)
+    group, agency = _duplicate_groups(ph, em, df.index)
+    out = _result_table(df, ph, em, group, agency)
+
+    # 連絡先あり -> 重複グループ順 -> 法人名 の順に並べる
+    has_info = (out["メールアドレス"] != "") | (out["電話番号"] != "")
+    out = out.assign(_has=has_info).sort_values(
+        ["_has", "重複グループ", "法人名"], ascending=[False, True, True], kind="stable")
+    return out.drop(columns="_has").reset_index(drop=True)
+
+
+def export_results(results, csv_path, jsonl_path=None, chunk_size=GAS_CHUNK):
+    """ResultStore を chunk_size 件ずつ読み、後処理済みの CSV（と再検証用の JSONL）に書き出す
+
+    全件の DataFrame は作らない。1回目の読み出しでは重複判定に使う電話番号・メールドメインだけを集め、
+    2回目に chunk ごとに整形して書き出す（行は取得順のまま。postprocess_results のような並べ替えはしない）。
+    (重複候補の件数, 共通連絡先の件数) を返す。
+    """
+    import pandas as pd
+
+    phones, emails = [], []
+    total = 0
+    with_query = False
+    for chunk in results.iter_chunks(chunk_size):
+        df = _result_frame(chunk, total)
+        ph, em = _contacts(df)
+        phones.append(ph)
+        emails.append(em[["site", "domain", "own"]])
+        with_query = with_query or "query" in df.columns
+        total += len(df)
+
+    jsonl = open(jsonl_path, "w", encoding="utf-8") if jsonl_path else None
+    try:
+        with open(csv_path, "w", newline="", encoding="utf-8-sig") as f:
+            if not total:
+                pd.DataFrame(columns=RESULT_COLUMNS).to_csv(f, index=False)
+                return 0, 0
+            group, agency = _duplicate_groups(pd.concat(phones), pd.concat(emails), pd.RangeIndex(total))
+            del phones, emails
+            start = 0
+            for chunk in results.iter_chunks(chunk_size):
+                df = _result_frame(chunk, start, with_query)
+                ph, em = _contacts(df)
+                _result_table(df, ph, em, group, agency).to_csv(f, header=not start, index=False)
+                if jsonl:
+                    jsonl.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in chunk)
+                start += len(df)
+    finally:
+        if jsonl:
+            jsonl.close()
+    return int((group > 0).sum()), int(agency.sum())
+
+
+def export_path(industry, region):
+    """書き出し先のパス（デスクトップ。なければカレントディレクトリ）"""
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     fname = f"企業リスト_{industry}_{region}_{ts}.csv"
     
@@ -509,59 +1896,401 @@ def save_csv(results, industry, region):
     if not os.path.isdir(desktop):
         desktop = os.getcwd()
         
-    path = os.path.join(desktop, fname)
-
-    with open(path, "w", newline="", encoding="utf-8-sig") as f:
-        w = csv.writer(f)
-        w.writerow(["法人名", "メールアドレス", "電話番号", "URL"])
-        for r in results:
-            w.writerow([
-                r["name"],
-                " / ".join(r["emails"]),
-                " / ".join(r["phones"]),
-                r["url"],
-            ])
-            
-    # 保存したフォルダを自動で開く（Windowsローカル環境のみ）
+    return os.path.join(desktop, fname)
+
+
+def open_folder(path):
+    """保存したフォルダを自動で開く（Windowsローカル環境のみ）"""
     try:
         if os.name == 'nt' and hasattr(os, 'startfile'):
             os.startfile(os.path.dirname(path))
     except Exception:
         pass
-        
+
+
+def save_csv(results, industry, region):
+    path = export_path(industry, region)
+
+    if hasattr(results, "to_csv"):
+        # postprocess_results の DataFrame
+        results.to_csv(path, index=False, encoding="utf-8-sig")
+    else:
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            w = csv.writer(f)
+            w.writerow(["法人名", "メールアドレス", "電話番号", "URL"])
+            for r in results:
+                w.writerow([
+                    r["name"],
+                    " / ".join(r["emails"]),
+                    " / ".join(r["phones"]),
+                    r["url"],
+                ])
+            
+    open_folder(path)
     return path
 
 
-def send_to_gsheet(results):
-    """結果をGoogleスプレッドシート（GAS）に送信"""
+def post_results(gas_url, results, chunk_size=GAS_CHUNK):
+    """結果を chunk_size 件ずつGASへ送信する。送信件数を返す（失敗時は例外）
+
+    再検証用のページ情報（sources）や確信度などの内部項目は送らず、GAS_FIELDS だけにする。
+    """
+    chunk = []
+    sent = 0
+    for r in results:
+        chunk.append({k: r[k] for k in GAS_FIELDS if k in r})
+        if len(chunk) >= chunk_size:
+            sent += _post_chunk(gas_url, chunk)
+            chunk = []
+    if chunk:
+        sent += _post_chunk(gas_url, chunk)
+    return sent
+
+
+def _post_chunk(gas_url, chunk):
+    # JSON で送信 (GAS側で JSON.parse できるように)
+    resp = get_session().post(gas_url, json={"results": chunk}, timeout=20)
+    if resp.status_code != 200:
+        raise RuntimeError(f"HTTP {resp.status_code}")
+    return len(chunk)
+
+
+def send_to_gsheet(results, gas_url=None):
+    """結果をGoogleスプレッドシート（GAS）に送信（gas_url 指定時は確認なし）"""
     print("\n--- Googleスプレッドシート連携 ---")
-    default_url = "https://script.google.com/macros/s/AKfycbzvixEvfoYYuJyx4HrHDQSawutXr37Jm1b54eJ-SNDKa7aT0q6bOsH2UcAwWsqQKSJH/exec"
-    print(f"  現在の設定URL: {default_url}")
-    print("  別のURLを使う場合は入力してください（そのまま使う場合はEnter）")
-    gas_url = input("  URL: ").strip() or default_url
+    if gas_url is None:
+        default_url = "https://script.google.com/macros/s/AKfycbzvixEvfoYYuJyx4HrHDQSawutXr37Jm1b54eJ-SNDKa7aT0q6bOsH2UcAwWsqQKSJH/exec"
+        print(f"  現在の設定URL: {default_url}")
+        print("  別のURLを使う場合は入力してください（そのまま使う場合はEnter）")
+        gas_url = input("  URL: ").strip() or default_url
     
     if not gas_url:
         print("  [*] 連携をスキップしました。")
         return False
 
-    print(f"  [*] {len(results)} 件のデータを送信中...")
+    print("  [*] データを送信中...")
     try:
-        payload = {"results": results}
-        # JSON で送信 (GAS側で JSON.parse できるように)
-        resp = requests.post(gas_url, json=payload, timeout=20)
-        
-        if resp.status_code == 200:
-            print("  [+] 送信成功！スプレッドシートを確認してください。")
-            return True
-        else:
-            print(f"  [!] 送信失敗: HTTP {resp.status_code}")
-            return False
+        sent = post_results(gas_url, results)
+        print(f"  [+] {sent} 件の送信成功！スプレッドシートを確認してください。")
+        return True
     except Exception as e:
-        print(f"  [!] エラー発生: {e}")
+        print(f"  [!] 送信失敗: {e}")
         return False
 
 
+# ===== バッチモード（非対話） =====
+def read_lines(path):
+    """1行1項目のテキストファイルを読み込む（空行・#コメントは無視）"""
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+
+def load_grid(path):
+    """industry,region[,count] 形式のCSVからクエリ一覧を読み込む"""
+    queries = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.reader(f):
+            row = [c.strip() for c in row]
+            if len(row) < 2 or not row[0] or row[0].startswith("#"):
+                continue
+            if row[0].lower() in ("industry", "業種"):
+                continue  # ヘッダー行
+            count = int(row[2]) if len(row) > 2 and row[2].isdigit() else None
+            queries.append({"industry": row[0], "region": row[1], "count": count})
+    return queries
+
+
+def build_batch_queries(args):
+    """コマンドライン引数から (業種 x 地域) のクエリ一覧とURLリストを組み立てる"""
+    queries = []
+    industries = list(args.industries or [])
+    regions = list(args.regions or [])
+    if args.industries_file:
+        industries += read_lines(args.industries_file)
+    if args.regions_file:
+        regions += read_lines(args.regions_file)
+    for industry in industries:
+        for region in regions:
+            queries.append({"industry": industry, "region": region, "count": None})
+    if args.grid:
+        queries += load_grid(args.grid)
+
+    for q in queries:
+        q["count"] = q["count"] or args.count
+        q["label"] = f"{q['industry']} {q['region']}"
+        q["urls"] = None
+        q["shard"] = args.shard
+
+    for path in args.urls or []:
+        urls = [u for u in read_lines(path) if u.startswith("http")]
+        queries.append({
+            "industry": "", "region": "", "count": len(urls),
+            "label": os.path.basename(path), "urls": urls,
+        })
+    return queries
+
+
+def search_urls(query, count, serper_api_key=""):
+    """検索APIがあればAPI、なければ Bing -> DuckDuckGo の順でURLを収集"""
+    if serper_api_key:
+        return search_via_api(query, count, serper_api_key)
+
+    urls = search_bing(query, count)
+    if len(urls) < 3:
+        seen = {urlparse(u).netloc for u in urls}
+        for u in search_ddg(query, count):
+            if urlparse(u).netloc not in seen:
+                urls.append(u)
+                seen.add(urlparse(u).netloc)
+    return urls
+
+
+def run_batch(queries, serper_api_key="", openai_api_key="", workers=8, dns=None, breaker=None,
+              job_budget=None, stats=None, llm_threshold=None, archive=None):
+    """全クエリを1プロセスで実行する。ドメイン単位で重複排除し、同じサイトは1回だけ解析する
+
+    job_budget: ジョブ全体の秒数上限。超えたら残りのサイトは打ち切り、集まった分だけ返す
+    stats: PathYieldStats（省略時は STATS_PATH のものを使い、終了時に保存する）
+    llm_threshold: LLMを呼ぶ確信度の閾値（scrape_site を参照）
+    archive: page_archive.PageArchive。指定すると取得したページをすべて保存する
+    """
+    scraped = {}   # domain -> Future（クエリ間で共有するスクレイピング結果キャッシュ）
+    lock = threading.Lock()
+    breakdown = []
+    dns = dns or DnsCache(connector=tcp_connector)  # クエリ間で共有するDNSキャッシュ
+    breaker = breaker or HostCircuitBreaker()       # 全ワーカーで共有するサーキットブレーカー
+    deadline = Deadline(job_budget)
+    stats = stats or PathYieldStats()
+    fetch = None
+    if archive is not None:
+        def fetch(page_url, page_breaker, page_deadline):
+            return fetch_page(page_url, page_breaker, page_deadline, archive=archive)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+
+        def submit(url, industry=""):
+            domain = urlparse(url).netloc.lower()
+            with lock:
+                fut = scraped.get(domain)
+                if fut is None:
+                    fut = pool.submit(scrape_site, url, openai_api_key, breaker, deadline, stats, industry,
+                                      llm_threshold, fetch)
+                    scraped[domain] = fut
+                    return domain, fut, True
+            return domain, fut, False
+
+        # STEP 1: 各クエリのURL検索も並行して実行
+        with ThreadPoolExecutor(max_workers=min(workers, 4)) as search_pool:
+            searches = []
+            for q in queries:
+                if q["urls"] is not None:
+                    searches.append((q, None))
+                elif q.get("shard"):
+                    searches.append((q, search_pool.submit(search_sharded, q["industry"], q["region"],
+                                                           q["count"], serper_api_key)))
+                else:
+                    searches.append((q, search_pool.submit(search_urls, q["label"], q["count"], serper_api_key)))
+
+            # 検索が終わったクエリから順にスクレイピングを投入する
+            jobs = []
+            for q, fut in searches:
+                try:
+                    urls = q["urls"] if fut is None else fut.result()
+                except Exception as e:
+                    print(f"  [!] {q['label']}: 検索エラー {e}")
+                    urls = []
+                urls, dead = prefilter_urls(urls, dns)
+                entries = [submit(u, q["industry"]) for u in urls]
+                jobs.append((q, urls, entries, len(dead)))
+                print(f"  [*] {q['label']}: {len(urls)} URLs")
+
+        # STEP 2: 結果の集約（ドメインごとに最初に見つかったクエリへ帰属）
+        rows = ResultStore()
+        owner = {}
+        for q, urls, entries, dead in jobs:
+            found = 0
+            dup = 0
+            cut = 0
+            saved = 0
+            structured = 0
+            structured_saved = 0
+            llm_saved = 0
+            llm_called = 0
+            for domain, fut, first in entries:
+                try:
+                    info = fut.result()
+                except Exception:
+                    continue
+                if domain in owner:
+                    dup += 1
+                    continue
+                owner[domain] = q["label"]
+                rows.append(dict(info, query=q["label"]))
+                if info.get("cut_short"):
+                    cut += 1
+                saved += info.get("probes_saved", 0)
+                if info.get("structured"):
+                    structured += 1
+                    structured_saved += info["structured"]
+                llm_saved += bool(info.get("llm_saved"))
+                llm_called += bool(info.get("llm_called"))
+                if info["emails"] or info["phones"]:
+                    found += 1
+            breakdown.append({
+                "query": q["label"],
+                "urls": len(urls),
+                "with_info": found,
+                "duplicates": dup,
+                "dead": dead,
+                "cut_short": cut,
+                "probes_saved": saved,
+                "structured": structured,
+                "structured_saved": structured_saved,
+                "llm_saved": llm_saved,
+                "llm_called": llm_called,
+            })
+
+    tripped = breaker.open_hosts()
+    if tripped:
+        print(f"  [*] circuit breaker: {len(tripped)} hosts stopped early")
+    stats.save()
+    return rows, breakdown
+
+
+def save_batch_csv(rows, path):
+    """バッチ結果を後処理して1つのCSVにまとめて保存（クエリ列付き）"""
+    postprocess_results(rows).to_csv(path, index=False, encoding="utf-8-sig")
+    return path
+
+
+def parse_args(argv=None):
+    import argparse
+    p = argparse.ArgumentParser(description="企業リサーチツール（バッチモード）")
+    p.add_argument("--industries", nargs="+", help="業種（複数可）")
+    p.add_argument("--regions", nargs="+", help="地域（複数可）")
+    p.add_argument("--industries-file", help="業種リスト（1行1件）")
+    p.add_argument("--regions-file", help="地域リスト（1行1件）")
+    p.add_argument("--grid", help="industry,region[,count] 形式のCSV")
+    p.add_argument("--urls", nargs="+", help="URLリストファイル（1行1URL, 複数可）")
+    p.add_argument("--count", type=int, default=20, help="クエリごとの取得件数（default 20）")
+    p.add_argument("--shard", action="store_true",
+                   help="都道府県・政令指定都市を市区単位のクエリに分けて検索する（大きな地域で件数を増やす）")
+    p.add_argument("--workers", type=int, default=8, help="同時に解析するサイト数（default 8）")
+    p.add_argument("--job-budget", type=float, help="ジョブ全体の時間上限（秒）。超えたら途中までの結果で終了")
+    p.add_argument("--llm-threshold", type=float,
+                   help=f"抽出結果の確信度がこれ未満のサイトだけLLMを呼ぶ（default {LLM_CONFIDENCE_THRESHOLD}、1超で常に呼ぶ）")
+    p.add_argument("--archive", help="取得したページを保存するディレクトリ（--reextract で再抽出できる）")
+    p.add_argument("--reextract", help="--archive で保存したページから、今の抽出処理で結果を作り直す")
+    p.add_argument("--refresh", help="前回の結果（.jsonl）の連絡先掲載ページだけを再検証する")
+    p.add_argument("--output", help="出力CSVのパス")
+    p.add_argument("--gas-url", help="指定するとスプレッドシートへ送信")
+    p.add_argument("--serper-key", default=os.environ.get("SERPER_API_KEY", ""))
+    p.add_argument("--openai-key", default=os.environ.get("OPENAI_API_KEY", ""))
+    return p.parse_args(argv)
+
+
+def jsonl_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".jsonl"
+
+
+def refresh_main(args):
+    rows = list(load_results_jsonl(args.refresh))
+    print(f"[REFRESH] {len(rows)} sites, workers={args.workers}")
+    store, counts = refresh_results(rows, args.workers, args.job_budget)
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = save_batch_csv(store, args.output or f"企業リスト_refresh_{ts}.csv")
+    save_results_jsonl(store, jsonl_path(path))
+    print("")
+    print("=" * 55)
+    print(f"  unchanged: {counts['unchanged']}  changed: {counts['changed']}  unverified: {counts['unverified']}")
+    print(f"  CSV: {path}")
+    print(f"  JSONL: {jsonl_path(path)}")
+    print("=" * 55)
+    store.close()
+    return 0
+
+
+def reextract_main(args):
+    """保存済みページだけを使って結果を作り直す（ネットワークには接続しない）"""
+    import page_archive
+    print(f"[REEXTRACT] {args.reextract}, workers={args.workers}")
+    start = time.monotonic()
+    store = ResultStore()
+    store.extend(page_archive.reextract(args.reextract, args.workers))
+    elapsed = time.monotonic() - start
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = save_batch_csv(store, args.output or f"企業リスト_reextract_{ts}.csv")
+    save_results_jsonl(store, jsonl_path(path))
+    print("")
+    print("=" * 55)
+    print(f"  total: {len(store)} sites / {store.with_info} with contacts ({elapsed:.1f}s)")
+    print(f"  CSV: {path}")
+    print(f"  JSONL: {jsonl_path(path)}")
+    print("=" * 55)
+    store.close()
+    return 0
+
+
+def batch_main(args):
+    if args.refresh:
+        return refresh_main(args)
+    if args.reextract:
+        return reextract_main(args)
+    queries = build_batch_queries(args)
+    if not queries:
+        print("  ERROR: --industries/--regions, --grid, --urls のいずれかを指定してください")
+        return 2
+
+    print(f"[BATCH] {len(queries)} queries, workers={args.workers}")
+    archive = None
+    if args.archive:
+        import page_archive
+        archive = page_archive.PageArchive(args.archive)
+    rows, breakdown = run_batch(queries, args.serper_key, args.openai_key, args.workers,
+                                job_budget=args.job_budget, llm_threshold=args.llm_threshold,
+                                archive=archive)
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = save_batch_csv(rows, args.output or f"企業リスト_batch_{ts}.csv")
+    save_results_jsonl(rows, jsonl_path(path))  # --refresh 用（連絡先の掲載ページ情報付き）
+
+    print("")
+    print("=" * 55)
+    for b in breakdown:
+        print(f"  [{b['query']}] urls:{b['urls']} found:{b['with_info']} dup:{b['duplicates']} "
+              f"dead:{b['dead']} cut:{b['cut_short']}")
+    print("-" * 55)
+    print(f"  total: {len(rows)} sites / {rows.with_info} with contacts")
+    saved = sum(b["probes_saved"] for b in breakdown)
+    print(f"  saved: {saved / len(rows) if len(rows) else 0:.2f} requests/site")
+    print(f"  structured data: {sum(b['structured'] for b in breakdown)} sites "
+          f"(fetches saved: {sum(b['structured_saved'] for b in breakdown)}, "
+          f"LLM calls saved: {sum(b['llm_saved'] for b in breakdown)})")
+    if args.openai_key:
+        called = sum(b["llm_called"] for b in breakdown)
+        print(f"  LLM calls: {called} / {len(rows)} sites ({called / len(rows) if len(rows) else 0:.0%})")
+    if args.openai_key and get_llm_cache() is not None:
+        c = get_llm_cache().stats()
+        print(f"  LLM cache: {c['hits']} hits / {c['misses']} misses "
+              f"(hit rate {c['hit_rate']:.0%}, ~{c['tokens_saved']} tokens saved)")
+    print(f"  CSV: {path}")
+    print(f"  JSONL: {jsonl_path(path)}")
+    if archive is not None:
+        print(f"  archive: {args.archive} ({archive.records} pages)")
+    print("=" * 55)
+
+    if args.gas_url and rows.with_info:
+        send_to_gsheet((r for r in rows if r["emails"] or r["phones"]), args.gas_url)
+    rows.close()
+    return 0
+
+
 def main():
+    if len(sys.argv) > 1:
+        sys.exit(batch_main(parse_args()))
+
     banner()
     industry, region, count = get_input()
     if not industry:
@@ -590,6 +2319,7 @@ def main():
         print("  [!] URL")
         urls = manual_url_input()
 
+    urls, _ = prefilter_urls(urls)
     if not urls:
         print("  URL -> ")
         return
@@ -600,13 +2330,15 @@ def main():
     print(f"[STEP 2] ...")
     print("")
     results = []
+    breaker = HostCircuitBreaker()
+    stats = PathYieldStats()
 
     for i, url in enumerate(urls, 1):
         domain = urlparse(url).netloc
         disp = domain[:35] + "..." if len(domain) > 35 else domain
         print(f"  [{i:3d}/{len(urls)}] {disp}", end=" ", flush=True)
 
-        info = scrape_site(url)
+        info = scrape_site(url, breaker=breaker, stats=stats, industry=industry)
         results.append(info)
 
         ec = len(info["emails"])
@@ -623,14 +2355,15 @@ def main():
 
         time.sleep(DELAY)
 
+    stats.save()
+
     # STEP 3: CSV
     print("")
     print("[STEP 3] CSV...")
 
     with_info = [r for r in results if r["emails"] or r["phones"]]
-    without = [r for r in results if not r["emails"] and not r["phones"]]
-    all_sorted = with_info + without
-    path = save_csv(all_sorted, industry, region)
+    table = postprocess_results(results)
+    path = save_csv(table, industry, region)
 
     # 結果
     print("")
@@ -640,6 +2373,10 @@ def main():
     print(f"  mail : {len([r for r in results if r['emails']])}")
     print(f"  tel  : {len([r for r in results if r['phones']])}")
     print(f"  total: {len(with_info)}")
+    print(f"  dup  : {int(table['重複候補'].sum())}")
+    print(f"  saved: {average_probes_saved(results):.2f} req/site")
+    print(f"  structured: {len([r for r in results if r.get('structured')])} sites "
+          f"(fetches saved: {sum(r.get('structured', 0) for r in results)})")
     print(f"")
     print(f"  CSV: {path}")
     print("=" * 55)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+LLM抽出結果のキャッシュ
+=======================
+extract_with_llm に渡すテキストのハッシュ（＋モデル名・プロンプトの版）をキーに、
+抽出結果 {"email", "phone"} を SQLite に保存する。同じ内容のページを再実行しても
+OpenAI API を呼ばずに前回の結果を返す。
+
+  cache = LLMCache("llm_cache.sqlite")
+  key = cache_key("gpt-4o-mini", 1, text)
+  result = cache.get(key)            # なければ None
+  cache.put(key, {"email": ..., "phone": ...}, tokens=1234)
+  cache.stats()                      # {"hits": .., "misses": .., "hit_rate": .., "tokens_saved": ..}
+
+古いエントリは ttl 秒で失効し、max_entries を超えたら最後に使われた時刻の古いものから消す。
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+CACHE_TTL = 30 * 24 * 3600   # 30日
+CACHE_MAX_ENTRIES = 20000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key      TEXT PRIMARY KEY,
+    result   TEXT NOT NULL,
+    tokens   INTEGER NOT NULL DEFAULT 0,
+    created  REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed);
+"""
+
+
+def cache_key(model, prompt_version, text):
+    """空白の違いは無視して、モデル名・プロンプトの版・テキストからキーを作る"""
+    normalized = re.sub(r"\s+", " ", text).strip()
+    h = hashlib.sha256(f"{model}\n{prompt_version}\n{normalized}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class LLMCache:
+    """SQLite に保存する LLM 抽出結果のキャッシュ（スレッドセーフ・複数プロセスから共有可）"""
+
+    def __init__(self, path, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+        with closing(self._connect()) as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def get(self, key):
+        """有効なエントリがあれば結果の dict を返す（なければ None）"""
+        now = time.time()
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT result, tokens, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[2] > self.ttl:
+                db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                row = None
+            if row:
+                db.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.tokens_saved += row[1]
+        return json.loads(row[0])
+
+    def put(self, key, result, tokens=0):
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("INSERT OR REPLACE INTO llm_cache (key, result, tokens, created, accessed) "
+                       "VALUES (?, ?, ?, ?, ?)",
+                       (key, json.dumps(result, ensure_ascii=False), int(tokens or 0), now, now))
+            self._evict(db, now)
+
+    def _evict(self, db, now):
+        db.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+        over = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+        if over > 0:
+            db.execute("DELETE FROM llm_cache WHERE key IN "
+                       "(SELECT key FROM llm_cache ORDER BY accessed LIMIT ?)", (over,))
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "tokens_saved": self.tokens_saved,
+            }
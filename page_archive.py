@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+取得ページのアーカイブ（WARC 形式）と再抽出
+===========================================
+fetch_page が取得したレスポンス（ステータス・ヘッダー・本文）を、ジョブごとのディレクトリに
+追記専用の圧縮ファイルとして保存する。抽出ルール（EMAIL_RE / PHONE_RE / ok_email / get_title など）
+を直したら、サイトを再クロールせずに、保存済みのページから結果を作り直せる。
+
+  archive/
+    pages-00000.warc.gz   ... 1レコード = 1つの gzip メンバー（WARC/1.0 response レコード）
+    pages-00001.warc.gz       SEGMENT_BYTES を超えたら次のファイルへ
+    index.jsonl           ... {"url", "segment", "offset", "length", "status", "date"}
+
+  py business_research.py --industries 美容院 --regions 渋谷区 --archive archive/
+  py business_research.py --reextract archive/ --output result_v2.csv --workers 8
+
+本文は Content-Encoding を解いた状態で保存する（Content-Length もそれに合わせて書き直す）。
+"""
+
+import gzip
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+SEGMENT_BYTES = 512 * 1024 * 1024   # 1ファイルの上限（圧縮後）
+INDEX_NAME = "index.jsonl"
+REEXTRACT_CHUNK = 200               # 1プロセスにまとめて渡すサイト数
+SKIP_HEADERS = {"content-encoding", "transfer-encoding", "content-length"}
+
+
+def segment_name(no):
+    return f"pages-{no:05d}.warc.gz"
+
+
+class PageArchive:
+    """ジョブ1回分のアーカイブ（スレッドセーフ・追記のみ）"""
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segment = 0
+        while os.path.exists(os.path.join(directory, segment_name(self._segment + 1))):
+            self._segment += 1
+        self.records = 0
+
+    def record(self, url, r):
+        """requests のレスポンス r（本文は読み込み済み）を1レコードとして追記する"""
+        body = r.content or b""
+        date = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        http = [f"HTTP/1.1 {r.status_code} {r.reason or ''}".rstrip()]
+        for k, v in r.headers.items():
+            if k.lower() not in SKIP_HEADERS:
+                http.append(f"{k}: {v}")
+        http.append(f"Content-Length: {len(body)}")
+        block = ("\r\n".join(http) + "\r\n\r\n").encode("utf-8", "replace") + body
+        warc = "\r\n".join([
+            "WARC/1.0",
+            "WARC-Type: response",
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+            f"WARC-Date: {date}",
+            f"WARC-Target-URI: {r.url or url}",
+            "Content-Type: application/http; msgtype=response",
+            f"Content-Length: {len(block)}",
+        ]).encode("utf-8") + b"\r\n\r\n" + block + b"\r\n\r\n"
+        data = gzip.compress(warc)
+
+        with self._lock:
+            path = os.path.join(self.directory, segment_name(self._segment))
+            if os.path.exists(path) and os.path.getsize(path) + len(data) > self.segment_bytes:
+                self._segment += 1
+                path = os.path.join(self.directory, segment_name(self._segment))
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(data)
+            entry = {"url": url, "segment": segment_name(self._segment), "offset": offset,
+                     "length": len(data), "status": r.status_code, "date": date}
+            with open(os.path.join(self.directory, INDEX_NAME), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.records += 1
+
+
+# ===== 読み出し =====
+def read_record(directory, segment, offset, length):
+    """1レコードを読み、(ステータス, ヘッダーの dict, 本文, 取得URL) を返す"""
+    with open(os.path.join(directory, segment), "rb") as f:
+        f.seek(offset)
+        raw = gzip.decompress(f.read(length))
+    warc_head, _, rest = raw.partition(b"\r\n\r\n")
+    target = ""
+    block_length = len(rest)
+    for line in warc_head.decode("utf-8", "replace").split("\r\n"):
+        k, _, v = line.partition(":")
+        if k == "WARC-Target-URI":
+            target = v.strip()
+        elif k == "Content-Length":
+            block_length = int(v)
+    http_head, _, body = rest[:block_length].partition(b"\r\n\r\n")
+    lines = http_head.decode("utf-8", "replace").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        k, _, v = line.partition(":")
+        headers[k.strip()] = v.strip()
+    return status, headers, body, target
+
+
+def load_index(directory):
+    """サイト（scheme://host）ごとに {URL: (segment, offset, length)} をまとめる。同じURLは新しい方を使う"""
+    sites = {}
+    with open(os.path.join(directory, INDEX_NAME), "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            e = json.loads(line)
+            u = urlparse(e["url"])
+            sites.setdefault(f"{u.scheme}://{u.netloc}", {})[e["url"]] = (e["segment"], e["offset"], e["length"])
+    return sites
+
+
+def archive_fetcher(directory, pages):
+    """scrape_site の fetch 引数として使える、アーカイブから応答を返す関数を作る（ネットワークは使わない）"""
+    from requests import Response
+    from requests.structures import CaseInsensitiveDict
+
+    def fetch(url, breaker=None, deadline=None):
+        loc = pages.get(url)
+        if loc is None:
+            return None  # 取得できなかった（または試していない）ページ
+        status, headers, body, target = read_record(directory, *loc)
+        r = Response()
+        r.status_code = status
+        r.headers = CaseInsensitiveDict(headers)
+        r._content = body
+        r.url = target or url
+        return r
+    return fetch
+
+
+# ===== 再抽出 =====
+def _reextract_chunk(directory, chunk):
+    """（子プロセスで実行）サイトごとに、今の抽出処理を保存済みページに対して実行する"""
+    import business_research as core
+    return [core.scrape_site(site + "/", fetch=archive_fetcher(directory, pages))
+            for site, pages in chunk]
+
+
+def reextract(directory, workers=None, chunk_size=REEXTRACT_CHUNK):
+    """アーカイブ全体を複数プロセスで再抽出し、サイトごとの結果を順に返す"""
+    sites = list(load_index(directory).items())
+    chunks = [sites[i:i + chunk_size] for i in range(0, len(sites), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(_reextract_chunk, [directory] * len(chunks), chunks):
+            yield from results
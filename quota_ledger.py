@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+利用枠のローカル台帳
+====================
+ジョブ開始時に利用枠を「予約」し、実際に処理したサイト数だけを「確定」する。
+確定分はまとめてバックグラウンドでマネージャーGAS（action: consume）へ送り、
+失敗したら間隔を空けて再送する。未送信分はファイルに残るので、再起動しても失われない。
+
+  ledger = UsageLedger(manager_url, user_id, password, current_usage=10, max_usage=1000)
+  r = ledger.reserve(50)          # 残り枠の範囲で最大50件を予約
+  ...
+  ledger.commit(r, used=42)       # 実際に処理した42件だけを確定（残り8件は枠に戻る）
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+FLUSH_SECONDS = 5      # 確定分をまとめて送る間隔
+USAGE_TTL = 60         # 利用状況をGASから取り直すまでの秒数
+MAX_BACKOFF = 300
+REQUEST_TIMEOUT = 10
+
+
+def http_transport(manager_url):
+    """マネージャーGASへ JSON をPOSTするトランスポート"""
+    def send(payload):
+        import business_research as core
+        resp = core.get_session().post(manager_url, json=payload, timeout=REQUEST_TIMEOUT)
+        if resp.status_code != 200:
+            raise RuntimeError(f"HTTP {resp.status_code}")
+        return resp.json()
+    return send
+
+
+class Reservation:
+    __slots__ = ("id", "count")
+
+    def __init__(self, count):
+        self.id = uuid.uuid4().hex
+        self.count = count
+
+
+class UsageLedger:
+    """1ユーザー分の利用枠台帳（スレッドセーフ）
+
+    transport を省略し manager_url も空なら、利用実績は記録しない（ローカル開発用。
+    同時に予約できるのが max_usage 件までになるだけで、使った分は枠を減らさない）。
+    """
+
+    def __init__(self, manager_url, user_id, password, current_usage=0, max_usage=1000,
+                 path=None, transport=None, flush_seconds=FLUSH_SECONDS, usage_ttl=USAGE_TTL):
+        self.user_id = user_id or "local"
+        self.password = password
+        self.current_usage = current_usage or 0   # GASで確定済みの利用数
+        self.max_usage = max_usage or 0
+        self.flush_seconds = flush_seconds
+        self.usage_ttl = usage_ttl
+        self.send = transport or (http_transport(manager_url) if manager_url else None)
+        self.path = path or os.path.join(tempfile.gettempdir(), f"usage_ledger_{self.user_id}.json")
+        self.last_error = ""
+        self._reserved = {}     # reservation id -> 件数
+        self._pending = []      # [{"id": ..., "count": n}] 確定済み・未送信
+        self._synced_at = time.time()
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        if self.send is not None:
+            self._load()
+            threading.Thread(target=self._run, daemon=True).start()
+
+    # --- 枠の計算 ---
+    def pending_count(self):
+        with self._lock:
+            return sum(p["count"] for p in self._pending)
+
+    def available(self):
+        """予約中・未送信分も差し引いた残り枠"""
+        with self._lock:
+            used = self.current_usage + sum(p["count"] for p in self._pending) + sum(self._reserved.values())
+        return max(self.max_usage - used, 0)
+
+    def reserve(self, count):
+        """残り枠の範囲で最大 count 件を予約する（0件のこともある）"""
+        with self._lock:
+            used = self.current_usage + sum(p["count"] for p in self._pending) + sum(self._reserved.values())
+            granted = max(min(count, self.max_usage - used), 0)
+            r = Reservation(granted)
+            self._reserved[r.id] = granted
+        return r
+
+    def commit(self, reservation, used):
+        """予約のうち used 件だけを確定し、残りは枠に戻す"""
+        with self._lock:
+            reserved = self._reserved.pop(reservation.id, 0)
+            used = max(min(used, reserved), 0)
+            if self.send is None:
+                return used  # ローカルのみの場合は記録しない
+            if used:
+                self._pending.append({"id": reservation.id, "count": used})
+                self._save()
+        self._wake.set()
+        return used
+
+    def release(self, reservation):
+        """予約を取り消す（ジョブが始まらなかった場合など）"""
+        with self._lock:
+            self._reserved.pop(reservation.id, None)
+
+    # --- GASとの同期 ---
+    def flush(self):
+        """未送信の確定分を1回の consume 呼び出しでまとめて送る。成功したら True"""
+        if self.send is None:
+            return True
+        with self._lock:
+            batch = list(self._pending)
+        if not batch:
+            return True
+        payload = {
+            "action": "consume",
+            "user_id": self.user_id,
+            "password": self.password,
+            "count": sum(p["count"] for p in batch),
+            # GAS側で二重計上を防ぐためのキー（再送時も同じ値）
+            "request_id": "+".join(p["id"] for p in batch),
+        }
+        result = self.send(payload)
+        if not result.get("success"):
+            raise RuntimeError(result.get("message") or "consume failed")
+        sent_ids = {p["id"] for p in batch}
+        with self._lock:
+            self._pending = [p for p in self._pending if p["id"] not in sent_ids]
+            if result.get("current_usage") is not None:
+                self.current_usage = result["current_usage"]
+            else:
+                self.current_usage += payload["count"]
+            self._synced_at = time.time()
+            self._save()
+        return True
+
+    def refresh_usage(self):
+        """GASから最新の利用状況を取り直す（ログインAPIを再利用）"""
+        if self.send is None:
+            return
+        result = self.send({"action": "login", "user_id": self.user_id, "password": self.password})
+        if result.get("success"):
+            with self._lock:
+                if result.get("current_usage") is not None:
+                    self.current_usage = result["current_usage"]
+                if result.get("max_usage") is not None:
+                    self.max_usage = result["max_usage"]
+                self._synced_at = time.time()
+
+    def maybe_refresh(self):
+        """TTLが切れていれば、バックグラウンドで利用状況を更新する（呼び出し側は待たない）"""
+        with self._lock:
+            if self.send is None or self._refreshing or time.time() - self._synced_at < self.usage_ttl:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh_usage()
+            except Exception as e:
+                self.last_error = str(e)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _run(self):
+        backoff = self.flush_seconds
+        while True:
+            self._wake.wait(backoff)
+            self._wake.clear()
+            time.sleep(self.flush_seconds)  # 少し待って複数ジョブの確定分をまとめる
+            try:
+                self.flush()
+                self.last_error = ""
+                backoff = self.flush_seconds
+            except Exception as e:
+                self.last_error = str(e)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+    # --- 未送信分の永続化 ---
+    def _save(self):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"pending": self._pending}, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._pending = json.load(f).get("pending", [])
+        except (OSError, ValueError):
+            self._pending = []
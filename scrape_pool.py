@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+全セッション共有のスクレイピング・ワーカープール
+================================================
+Streamlit の各セッションがそれぞれ scrape_site を回す代わりに、プロセスに1つだけの
+プールへタスクを預ける。
+
+  - 同時に動くスクレイピングは全体で workers 件まで（外向きの接続数の上限）
+  - 同じホストへの同時アクセスは per_host 件まで
+  - ユーザーごとのキューから、重み（残り利用枠など）に応じて公平に取り出す
+    （大きなジョブを投げたユーザーがいても、他のユーザーのタスクが後回しにならない）
+
+  pool = ScrapePool()
+  fut = pool.submit("user-a", weight=quota_weight(950), fn=core.scrape_site, url="https://example.jp/")
+  pool.queue_info("user-a")   # {"pending": .., "ahead": .., "running": .., "users": ..}
+  info = fut.result()
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import Future
+from itertools import islice
+from urllib.parse import urlparse
+
+POOL_WORKERS = 16      # プロセス全体で同時に動かすスクレイピングの数
+PER_HOST_LIMIT = 1     # 同じホストへの同時アクセス数
+SCAN_LIMIT = 50        # ホストが埋まっている場合に、キューの先を探す件数
+MAX_WEIGHT = 4         # 重みの上限（重みの最小は1なので、ユーザー間の処理枠の比は最大 4:1）
+WEIGHT_STEP = 250      # 残り利用枠がこの件数増えるごとに重みを1上げる
+
+
+def quota_weight(remaining):
+    """残り利用枠から重み（1〜MAX_WEIGHT）を決める。枠の差がそのまま処理枠の差にならないよう段階的にする"""
+    return min(1 + max(int(remaining or 0), 0) // WEIGHT_STEP, MAX_WEIGHT)
+
+
+class _Task:
+    __slots__ = ("future", "host", "fn", "args", "kwargs")
+
+    def __init__(self, future, host, fn, args, kwargs):
+        self.future = future
+        self.host = host
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+
+class ScrapePool:
+    """ユーザー単位の重み付き公平キュー付きワーカープール（スレッドセーフ）
+
+    各ユーザーは仮想時刻を持ち、タスクを1件取り出すたびに 1 / 重み だけ進む。
+    仮想時刻が最も小さいユーザーから取り出すので、重みの比で処理枠が配分される。
+    """
+
+    def __init__(self, workers=POOL_WORKERS, per_host=PER_HOST_LIMIT):
+        self.workers = workers
+        self.per_host = per_host
+        self._cond = threading.Condition()
+        self._queues = {}    # user -> deque[_Task]（待ちタスクがあるユーザーだけ）
+        self._weights = {}   # user -> 重み
+        self._pass = {}      # user -> 仮想時刻
+        self._vtime = 0.0    # 直近に取り出したタスクの仮想時刻
+        self._hosts = {}     # host -> 実行中の数
+        self._running = 0
+        for i in range(workers):
+            threading.Thread(target=self._work, daemon=True, name=f"scrape-pool-{i}").start()
+
+    def submit(self, user, weight, fn, url, *args, **kwargs):
+        """fn(url, *args, **kwargs) をユーザー user のタスクとして預け、Future を返す"""
+        fut = Future()
+        task = _Task(fut, urlparse(url).netloc.lower(), fn, (url,) + args, kwargs)
+        with self._cond:
+            q = self._queues.get(user)
+            if q is None:
+                q = self._queues[user] = deque()
+                # しばらく待ちがなかったユーザーが、溜めた分で割り込まないようにする
+                self._pass[user] = max(self._pass.get(user, 0.0), self._vtime)
+            self._weights[user] = min(max(float(weight or 0), 1.0), MAX_WEIGHT)
+            q.append(task)
+            self._cond.notify()
+        return fut
+
+    def queue_info(self, user):
+        """user の待ち件数と、その次のタスクより先に処理される見込みの他ユーザーのタスク数"""
+        with self._cond:
+            q = self._queues.get(user)
+            pending = sum(1 for t in q if not t.future.cancelled()) if q else 0
+            ahead = 0
+            if pending:
+                mine = self._pass[user] + 1.0 / self._weights[user]
+                for other, oq in self._queues.items():
+                    if other != user:
+                        k = int((mine - self._pass[other]) * self._weights[other])
+                        ahead += min(len(oq), max(k, 0))
+            return {"pending": pending, "ahead": ahead, "running": self._running,
+                    "users": len(self._queues)}
+
+    def _pick(self):
+        """仮想時刻の小さいユーザーから、ホストの空いているタスクを1件取り出す（ロック内で呼ぶ）"""
+        for user in sorted(self._queues, key=self._pass.get):
+            q = self._queues[user]
+            while q and q[0].future.cancelled():
+                q.popleft()  # 取り消し済みは枠を消費せずに捨てる
+            for i, t in enumerate(islice(q, SCAN_LIMIT)):
+                if t.future.cancelled() or self._hosts.get(t.host, 0) >= self.per_host:
+                    continue
+                del q[i]
+                self._vtime = self._pass[user]
+                self._pass[user] += 1.0 / self._weights[user]
+                self._hosts[t.host] = self._hosts.get(t.host, 0) + 1
+                self._running += 1
+                break
+            else:
+                t = None
+            if not q:
+                del self._queues[user]
+            if t is not None:
+                return t
+        return None
+
+    def _release(self, host):
+        with self._cond:
+            self._running -= 1
+            self._hosts[host] -= 1
+            if not self._hosts[host]:
+                del self._hosts[host]
+            self._cond.notify_all()  # そのホスト待ちのタスクを動かせるようになった
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._pick()
+                while task is None:
+                    self._cond.wait()
+                    task = self._pick()
+            if not task.future.set_running_or_notify_cancel():
+                self._release(task.host)
+                continue
+            try:
+                task.future.set_result(task.fn(*task.args, **task.kwargs))
+            except BaseException as e:
+                task.future.set_exception(e)
+            finally:
+                self._release(task.host)
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+分散スクレイピング用 URL ワークキュー
+====================================
+scrape_site の処理を複数のワーカープロセス／マシンに分散する。
+
+- 既定のバックエンドは SQLite（1ファイルで完結、同一マシン内の複数プロセスで共有可）
+- `serve` で SQLite キューを HTTP 経由で公開し、他マシンのワーカーは RemoteQueue で接続
+  （既定は 127.0.0.1 のみで待ち受け。共有トークン（X-Queue-Token ヘッダー）が一致しない要求は拒否）
+- リース＋ハートビート方式：落ちたワーカーのURLはリース期限切れで自動的に再キューされる
+- ホスト単位のアフィニティ：同じドメインは同時に1ワーカーだけが処理する（アクセス間隔を維持）
+
+使い方:
+  py work_queue.py enqueue --db jobs.sqlite --urls urls.txt
+  py work_queue.py worker  --db jobs.sqlite            (同一マシン)
+  py work_queue.py serve   --db jobs.sqlite --host 0.0.0.0 --port 8765 --token <共有トークン>
+  py work_queue.py worker  --remote http://host:8765 --token <共有トークン>   (別マシン)
+  （--token を省略すると環境変数 QUEUE_TOKEN を使う。serve でどちらも無ければ生成して表示する）
+  py work_queue.py merge   --db jobs.sqlite --output result.csv
+"""
+
+import argparse
+import hmac
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+from urllib.parse import urlparse
+
+import business_research as core
+
+LEASE_SECONDS = 120      # ハートビートが途絶えてからURLを再キューするまでの秒数
+HEARTBEAT_SECONDS = 20
+TOKEN_HEADER = "X-Queue-Token"
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT UNIQUE NOT NULL,
+    host TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',   -- queued / leased / done / failed
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_items_state ON items(state, host);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    worker TEXT,
+    lease_until REAL
+);
+"""
+
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+
+class SQLiteQueue:
+    """SQLite ファイルをバックエンドにしたワークキュー"""
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        with closing(self._connect()) as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def _tx(self, fn):
+        """BEGIN IMMEDIATE で書き込みロックを取ってから fn(db) を実行"""
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(db)
+                db.execute("COMMIT")
+                return out
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        finally:
+            db.close()
+
+    def put(self, urls):
+        """URLを追加（同一URLは無視）。追加件数を返す"""
+        def fn(db):
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO items (url, host) VALUES (?, ?)",
+                [(u, host_of(u)) for u in urls],
+            )
+            return db.total_changes - before
+        return self._tx(fn)
+
+    def _requeue_expired(self, db, now, max_attempts=MAX_ATTEMPTS):
+        # 期限切れ（ワーカーが落ちた等）は再キュー。何度も落とすURLは fail と同じく上限で打ち切る
+        db.execute(
+            "UPDATE items SET state=CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "worker=NULL, lease_until=NULL, "
+            "error=CASE WHEN attempts >= ? THEN 'lease expired' ELSE error END "
+            "WHERE state='leased' AND lease_until < ?", (max_attempts, max_attempts, now))
+        db.execute("DELETE FROM hosts WHERE lease_until < ?", (now,))
+
+    def lease(self, worker_id, limit=1):
+        """処理するURLを借りる。[(item_id, url), ...] を返す
+
+        他のワーカーが処理中のホストは避け、自分が持っているホストを優先する。
+        """
+        def fn(db):
+            now = time.time()
+            until = now + self.lease_seconds
+            self._requeue_expired(db, now)
+            rows = db.execute(
+                "SELECT i.id, i.url, i.host FROM items i "
+                "LEFT JOIN hosts h ON h.host = i.host "
+                "WHERE i.state='queued' AND (h.worker IS NULL OR h.worker = ?) "
+                "ORDER BY (h.worker = ?) DESC, i.id LIMIT ?",
+                (worker_id, worker_id, limit)).fetchall()
+            for item_id, _, host in rows:
+                db.execute(
+                    "UPDATE items SET state='leased', worker=?, lease_until=?, attempts=attempts+1 "
+                    "WHERE id=?", (worker_id, until, item_id))
+                db.execute(
+                    "INSERT INTO hosts (host, worker, lease_until) VALUES (?, ?, ?) "
+                    "ON CONFLICT(host) DO UPDATE SET worker=excluded.worker, lease_until=excluded.lease_until",
+                    (host, worker_id, until))
+            return [(item_id, url) for item_id, url, _ in rows]
+        return self._tx(fn)
+
+    def heartbeat(self, worker_id):
+        """このワーカーが持っているリースをすべて延長する"""
+        def fn(db):
+            until = time.time() + self.lease_seconds
+            db.execute("UPDATE items SET lease_until=? WHERE state='leased' AND worker=?", (until, worker_id))
+            db.execute("UPDATE hosts SET lease_until=? WHERE worker=?", (until, worker_id))
+            return True
+        return self._tx(fn)
+
+    def complete(self, item_id, worker_id, result):
+        def fn(db):
+            cur = db.execute(
+                "UPDATE items SET state='done', result=?, lease_until=NULL "
+                "WHERE id=? AND worker=? AND state='leased'",
+                (json.dumps(result, ensure_ascii=False), item_id, worker_id))
+            self._release_idle_host(db, item_id, worker_id)
+            return cur.rowcount == 1
+        return self._tx(fn)
+
+    def fail(self, item_id, worker_id, error, max_attempts=MAX_ATTEMPTS):
+        """失敗を記録。試行回数が上限未満なら再キューする"""
+        def fn(db):
+            db.execute(
+                "UPDATE items SET state=CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "worker=NULL, lease_until=NULL, error=? WHERE id=? AND worker=?",
+                (max_attempts, str(error)[:500], item_id, worker_id))
+            self._release_idle_host(db, item_id, worker_id)
+            return True
+        return self._tx(fn)
+
+    def _release_idle_host(self, db, item_id, worker_id):
+        # そのホストの処理中アイテムがなくなったらホストのロックを解放
+        db.execute(
+            "DELETE FROM hosts WHERE worker=? AND host=(SELECT host FROM items WHERE id=?) "
+            "AND NOT EXISTS (SELECT 1 FROM items WHERE host=hosts.host AND state='leased')",
+            (worker_id, item_id))
+
+    def stats(self):
+        with closing(self._connect()) as db:
+            counts = dict(db.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall())
+        return {s: counts.get(s, 0) for s in ("queued", "leased", "done", "failed")}
+
+    def results(self):
+        with closing(self._connect()) as db:
+            rows = db.execute("SELECT result FROM items WHERE state='done' ORDER BY id").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+
+# ===== ネットワークバックエンド =====
+OPS = ("put", "lease", "heartbeat", "complete", "fail", "stats", "results")
+
+
+def http_transport(url, token, timeout=30):
+    """コーディネーターへ JSON をPOSTするトランスポート（共有トークンをヘッダーに付ける）"""
+    def send(op, args):
+        resp = core.get_session().post(url, json={"op": op, "args": args}, timeout=timeout,
+                                       headers={TOKEN_HEADER: token})
+        resp.raise_for_status()
+        return resp.json()["result"]
+    return send
+
+
+def local_transport(queue):
+    """同一プロセス内のキューを直接呼ぶトランスポート（テスト・単体運用向けのスタンドイン）
+
+    JSON を一度通して、HTTP 経由と同じ値だけが受け渡されるようにする。
+    """
+    def send(op, args):
+        args = json.loads(json.dumps(args))
+        return json.loads(json.dumps(getattr(queue, op)(*args)))
+    return send
+
+
+class RemoteQueue:
+    """トランスポート経由で別プロセスのキューを操作するクライアント"""
+
+    def __init__(self, url=None, transport=None, token=""):
+        self._send = transport or http_transport(url, token)
+
+    def __getattr__(self, op):
+        if op not in OPS:
+            raise AttributeError(op)
+        return lambda *args: self._send(op, list(args))
+
+
+def serve(queue, host="127.0.0.1", port=8765, token=""):
+    """キューを HTTP で公開する（コーディネーター）
+
+    結果の取得やURLの投入ができるので、ヘッダーの共有トークンが token と一致する要求だけを受け付ける。
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    if not token:
+        raise ValueError("token is required")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode("utf-8"), token.encode("utf-8")):
+                out = json.dumps({"error": "unauthorized"}).encode("utf-8")
+                self.send_response(401)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if body.get("op") not in OPS:
+                    raise ValueError(f"unknown op: {body.get('op')}")
+                out = json.dumps({"result": getattr(queue, body["op"])(*body.get("args", []))},
+                                 ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+            except Exception as e:
+                out = json.dumps({"error": str(e)}).encode("utf-8")
+                self.send_response(400)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"  [*] queue coordinator: http://{host}:{port}/")
+    return server
+
+
+# ===== ワーカー / コーディネーター =====
+def run_worker(queue, worker_id=None, openai_api_key="", heartbeat_seconds=HEARTBEAT_SECONDS,
+               idle_exit=True, scrape=None):
+    """キューが空になるまで URL を借りて scrape_site を実行する。処理件数を返す"""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    scrape = scrape or core.scrape_site
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(heartbeat_seconds):
+            try:
+                queue.heartbeat(worker_id)
+            except Exception as e:
+                print(f"  [!] heartbeat error: {e}")
+
+    threading.Thread(target=beat, daemon=True).start()
+    done = 0
+    try:
+        while True:
+            items = queue.lease(worker_id, 1)
+            if not items:
+                stats = queue.stats()
+                if idle_exit and stats["queued"] == 0 and stats["leased"] == 0:
+                    break
+                time.sleep(1)  # 他ワーカーが処理中のホストしか残っていない
+                continue
+            for item_id, url in items:
+                try:
+                    queue.complete(item_id, worker_id, scrape(url, openai_api_key))
+                    done += 1
+                    print(f"  [{worker_id}] {host_of(url)} -> done")
+                except Exception as e:
+                    queue.fail(item_id, worker_id, repr(e))
+                    print(f"  [{worker_id}] {host_of(url)} -> error {e}")
+                time.sleep(core.DELAY)
+    finally:
+        stop.set()
+    return done
+
+
+def wait_until_done(queue, poll_seconds=5):
+    while True:
+        s = queue.stats()
+        if s["queued"] == 0 and s["leased"] == 0:
+            return s
+        print(f"  [*] queued:{s['queued']} leased:{s['leased']} done:{s['done']} failed:{s['failed']}")
+        time.sleep(poll_seconds)
+
+
+def merge_results(queue, path):
+    """全ワーカーの結果をドメイン単位で重複排除し、1つのCSVにまとめる"""
+    seen = set()
+    rows = []
+    for r in queue.results():
+        domain = host_of(r["url"])
+        if domain in seen:
+            continue
+        seen.add(domain)
+        rows.append(dict(r, query=""))
+    return core.save_batch_csv(rows, path)
+
+
+def open_queue(args):
+    if args.remote:
+        return RemoteQueue(args.remote, token=args.token)
+    return SQLiteQueue(args.db)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="分散スクレイピング用 URL ワークキュー")
+    p.add_argument("command", choices=["enqueue", "worker", "serve", "merge", "stats"])
+    p.add_argument("--db", default="jobs.sqlite", help="SQLite キューファイル")
+    p.add_argument("--remote", help="コーディネーターのURL（worker/stats/merge 用）")
+    p.add_argument("--urls", nargs="+", help="URLリストファイル（enqueue 用）")
+    p.add_argument("--host", default="127.0.0.1", help="serve の待ち受けアドレス（別マシンから使うなら 0.0.0.0 など）")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--token", default=os.environ.get("QUEUE_TOKEN", ""),
+                   help="コーディネーターとワーカーの共有トークン（default: 環境変数 QUEUE_TOKEN）")
+    p.add_argument("--output", help="出力CSV（merge 用）")
+    p.add_argument("--wait", action="store_true", help="merge 前に全件完了まで待つ")
+    p.add_argument("--openai-key", default=os.environ.get("OPENAI_API_KEY", ""))
+    args = p.parse_args(argv)
+
+    if args.command == "serve":
+        token = args.token or secrets.token_urlsafe(24)
+        if not args.token:
+            print(f"  [*] token: {token}  (ワーカーは --token または QUEUE_TOKEN で指定)")
+        server = serve(SQLiteQueue(args.db), host=args.host, port=args.port, token=token)
+        server.serve_forever()
+        return 0
+
+    queue = open_queue(args)
+    if args.command == "enqueue":
+        urls = []
+        for path in args.urls or []:
+            urls += [u for u in core.read_lines(path) if u.startswith("http") and not core.skip_url(u)]
+        print(f"  [+] {queue.put(urls)} URLs queued")
+    elif args.command == "worker":
+        print(f"  [+] {run_worker(queue, openai_api_key=args.openai_key)} sites processed")
+    elif args.command == "stats":
+        print(json.dumps(queue.stats()))
+    elif args.command == "merge":
+        if args.wait:
+            wait_until_done(queue)
+        ts = time.strftime("%Y%m%d_%H%M%S")
+        print(f"  CSV: {merge_results(queue, args.output or f'企業リスト_queue_{ts}.csv')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())